@@ -1,17 +1,20 @@
 import os
 import sys
-import collections
-import time
 import images
 import locale
-import threading
 import wx.adv
 import wx
 import queue
 import subprocess
+import time
 from wx.lib.throbber import Throbber
 import datetime
-from search_functions import binary_search, combined_search, docm_python_search, docx_python_search, xlsx_search, pdf_search, vsdx_search, xls_search, is_log_file, log_search
+import multiprocessing
+import re
+from search_functions import SearchTerms, TERM_SEPARATOR
+from search_engine import CancelToken, default_workers, IndexThread, SearchThread
+from search_index import has_index, IndexWatcher
+from result_store import ResultStore
 # import wx.richtext
 import openpyxl
 from openpyxl import Workbook
@@ -49,13 +52,6 @@ except ImportError as err:
         str(err), "PyMuPDF required: https://pypi.org/project/PyMuPDF/",
         "\tpython -m pip install pymupdf")))
 
-try:
-    from vsdx import VisioFile     # vsdx library
-except ImportError as err:
-    raise ImportError('\n'.join((
-        str(err), "vsdx required: https://pypi.org/project/vsdx/",
-        "\tpython -m pip install vsdx")))
-
 # Application defines --------------------------------------------------
 APPNAME = "PurrSearch"
 VENDORNAME = "Evertz"
@@ -79,106 +75,6 @@ VERSIONINFO = {
     'comments': '', 'legalTrademarks': '', }
 
 
-class SearchThread(threading.Thread):
-    """Thread to perform searches on all files in a particular folder."""
-    def __init__(self, parent, path, text, result_queue):
-        super().__init__()
-        self.parent = parent
-        self.path = path
-        self.text = text
-        self.result_queue = result_queue
-
-        self.initial_message = None
-        self.progress = 0
-        self.statusText = "Status: Not Running"
-        self.error = None
-
-    def run(self):
-        if self.parent.end_event.is_set(): # means the search is set to stop
-            return
-        try:
-            self.performSearch(self.path, self.text)
-        except Exception as err:
-            self.error = f"Search failed with error: {err}"
-            self.result_queue.put(('error', self.error))
-
-    def performSearch(self, path, text):
-        start_time = time.time()  # Start timing the search
-        processed_files = 0
-        files_with_matches = 0  # Counter for files that have matches
-        total_files, self.initial_message = self.parent.calculateTotalFiles(path)
-
-        self.result_queue.put(('status', self.initial_message))
-        self.result_queue.put(('progress', self.progress, "0%"))
-
-        # Implement the search across files, skipping temporary and unrelated file formats
-        skipped_formats = ['.jpg', '.db', '.png', '.wbk', '.jpeg', '.pptx', '.shs', '.lnk', '.tmp', '.bmp', '.msg', '.vsd']
-        for root, dirs, files in os.walk(path):
-            for file in files:
-                if self.parent.end_event.is_set():
-                    self.result_queue.put(('status', "\n\n\u1360 Search stopped by user.\u1360\n"))
-                    self.result_queue.put(('progress', 100, "Stopped"))
-                    return
-
-                if file.startswith('~$'):
-                    continue
-
-                file_path = os.path.join(root, file)
-                extension = os.path.splitext(file_path)[1].lower()
-                self.result_queue.put(('status_bar', f"Searching in file: {file}"))
-
-                if extension in skipped_formats:
-                    continue
-
-                try:
-                    matches = []
-                    # Check if it's a log file (including gzipped logs)
-                    if is_log_file(file_path):
-                        matches = log_search(file_path, text)
-                    elif extension in ['.txt', '.rtf', '.csv', '.mib', '.bat', '.sh', '.c', '.cpp', '.h', '.cs', 'html', '.htm', '.css', '.php', '.js', '.xml', '.ini', '.cfg', '.json', '.java', '.tex', '.rst', '.md', '.ps', '.nfo', '.info', '.py', '.yaml', '.toml']:
-                        matches = binary_search(file_path, text)
-                    elif extension == '.xls':
-                        matches = xls_search(file_path, text)
-                    elif extension in ['.doc', '.dot']:
-                        matches = combined_search(file_path, text)
-                    elif extension == '.docx':
-                        matches = docx_python_search(file_path, text)
-                    elif extension == '.docm':
-                        matches = docm_python_search(file_path, text)
-                    elif extension == '.xlsx':
-                        matches = xlsx_search(file_path, text)
-                    elif extension == '.pdf':
-                        matches = pdf_search(file_path, text)
-                    elif extension == '.vsdx':
-                        matches = vsdx_search(file_path, text)
-
-
-                    if matches:
-                        result_text = "\n".join(matches)
-                        self.result_queue.put(('result', file, len(matches), result_text, file_path))
-                        files_with_matches += 1
-                except Exception as e:
-                    self.error = f"\n\nError processing {file_path}: {e}\n\n"
-                    self.result_queue.put(('error', self.error))
-
-                # Update the progress bar and percentage
-                processed_files += 1
-                self.progress = int((processed_files / total_files) * 100)
-                self.result_queue.put(('progress', self.progress, f"{self.progress}%"))
-
-        # Calculate the total search time, reset the search button
-        elapsed_time = time.time() - start_time
-        self.initial_message = f"\n\nSearch finished in {elapsed_time:.3f} seconds. {files_with_matches} files found with matches."
-        self.result_queue.put(('status', self.initial_message))
-        self.result_queue.put(('complete',))
-        self.parent.end_event.set()
-
-    def stop(self, block=True):
-        """Signal the thread to end."""
-        self.parent.end_event.set()
-# end class SearchThread(threading.Thread)
-
-
 class DetailsDialog(wx.Dialog):
     """Simple dialog to show search results."""
     def __init__(self, parent, details: str):
@@ -211,22 +107,40 @@ class ResultsList(wx.ListCtrl):
     def __init__(self, parent, style=0):
         super().__init__(parent, style=style | wx.LC_VIRTUAL | wx.LC_REPORT |
                          wx.LC_SINGLE_SEL)
-        self.items: list[tuple[str, str, str, str]] = []
+        self.items = ResultStore()  # Rows as (file, matches, details, path).
         for num, (title, alignment, width) in enumerate(self.COLUMNS):
             self.InsertColumn(num, title, format=alignment, width=width)
 
     def OnGetItemText(self, item, column):
         """Return the text to be displayed for the given item (row) and column"""
-        return self.items[item][column]
+        # Only the Details column needs to read the row's details back.
+        if column == 0:
+            return self.items.names[item]
+        if column == 1:
+            return str(self.items.matches[item])
+        if column == 2:
+            return self.items.details(item)
+        return self.items.path(item)
 # end class ResultsList(wx.ListCtrl)
 
 
 class MainPanel(wx.Panel):
+    # The search thread waits when this many messages are waiting for the UI.
+    RESULT_QUEUE_SIZE = 1000
+    # Most time (seconds) and messages that one timer tick spends on the
+    # result queue; whatever is left is handled on the next tick.
+    DRAIN_TIME = 0.05
+    DRAIN_ITEMS = 200
+    # Matches listed for each file unless the user sets another limit.
+    DEFAULT_MAX_MATCHES = 1000
+
     def __init__(self, parent, wx_config: wx.ConfigBase):
         super().__init__(parent)
         self.search_thread = None
-        self.end_event = threading.Event()
-        self.result_queue = queue.Queue()
+        self.index_watcher = None  # Keeps the folder's index live (Linux only).
+        self.end_event = CancelToken()  # Stops the running search or indexing.
+        self.result_queue = queue.Queue(maxsize=self.RESULT_QUEUE_SIZE)
+        self.summary_end = 0  # End of the file count summary in resultsCtrl.
 
         self.initial_layout_done = False  # Flag to control when to adjust column width
 
@@ -256,11 +170,28 @@ class MainPanel(wx.Panel):
         self.browseBtn = wx.Button(self, label="Browse")
         self.browseBtn.SetBitmap(images.browse_16.GetBitmap())
 
+        # Full-text index of the selected folder.
+        self.indexBtn = wx.Button(self, label="Index")
+        self.indexBtn.SetToolTip("Index this folder so it can be searched without reading every file")
+        self.useIndexCheck = wx.CheckBox(self, label="Search index")
+        self.useIndexCheck.SetValue(self.wx_config.ReadBool('/useIndex', defaultVal=False))
+        self.useIndexCheck.SetToolTip("Search the folder's index instead of its files")
+        self.pdfHitsCheck = wx.CheckBox(self, label="PDF hit search")
+        self.pdfHitsCheck.SetValue(self.wx_config.ReadBool('/pdfHits', defaultVal=False))
+        self.pdfHitsCheck.SetToolTip("Find matches in PDFs with PyMuPDF's page search, "
+                                     "listing where each one is on the page")
+
         hbox1.Add(label, flag=wx.ALIGN_CENTER_VERTICAL)
         hbox1.AddSpacer(10)
         hbox1.Add(self.dirCtrl, proportion=1)
         hbox1.AddSpacer(10)
         hbox1.Add(self.browseBtn)
+        hbox1.AddSpacer(10)
+        hbox1.Add(self.indexBtn)
+        hbox1.AddSpacer(10)
+        hbox1.Add(self.useIndexCheck, flag=wx.ALIGN_CENTER_VERTICAL)
+        hbox1.AddSpacer(10)
+        hbox1.Add(self.pdfHitsCheck, flag=wx.ALIGN_CENTER_VERTICAL)
 
         # Text Search -------------------------------------------------
         hbox2 = wx.BoxSizer(wx.HORIZONTAL)
@@ -268,6 +199,7 @@ class MainPanel(wx.Panel):
         self.search_history = self.loadSearchHistory()
 
         self.searchCtrl = wx.ComboBox(self, choices=self.search_history + ["*** Clear Search & Path History ***"], style=wx.CB_DROPDOWN  | wx.TE_PROCESS_ENTER)
+        self.searchCtrl.SetToolTip(f"Separate several search terms with '{TERM_SEPARATOR}'")
         self.searchCtrl.Bind(wx.EVT_COMBOBOX, self.onComboBoxSelect)
         self.searchCtrl.Bind(wx.EVT_TEXT_ENTER, self.onStartSearch)
 
@@ -275,17 +207,49 @@ class MainPanel(wx.Panel):
         if self.search_history:
             self.searchCtrl.SetValue(self.search_history[0])  # Select the most recent search term
 
+        # Treat the search text as a regular expression instead of terms.
+        self.regexCheck = wx.CheckBox(self, label="Regex")
+        self.regexCheck.SetValue(self.wx_config.ReadBool('/regex', defaultVal=False))
+        self.regexCheck.SetToolTip("Search for a regular expression")
+
+        # Limit the matches listed for each file, or only list the files.
+        self.filesOnlyCheck = wx.CheckBox(self, label="Files only")
+        self.filesOnlyCheck.SetValue(self.wx_config.ReadBool('/filesOnly', defaultVal=False))
+        self.filesOnlyCheck.SetToolTip("Only list the files with matches, stopping at the first match in each")
+        maxMatchesLabel = wx.StaticText(self, label="Max matches:")
+        max_matches = self.wx_config.ReadInt('/maxMatches', defaultVal=self.DEFAULT_MAX_MATCHES)
+        self.maxMatchesCtrl = wx.SpinCtrl(self, min=0, max=max(1000000, max_matches), initial=max_matches, size=(80, -1))
+        self.maxMatchesCtrl.SetToolTip("Stop reading a file after this many matches (0 for no limit)")
+
         self.startSearchBtn = wx.Button(self, label="Search")
         self.stopSearchBtn = wx.Button(self, label="Stop")
         self.stopSearchBtn.Disable()
 
+        # Number of worker processes used to search files in parallel.
+        workersLabel = wx.StaticText(self, label="Workers:")
+        workers = self.wx_config.ReadInt('/workers', defaultVal=default_workers())
+        self.workersCtrl = wx.SpinCtrl(self, min=1, max=max(64, workers), initial=workers, size=(60, -1))
+        self.workersCtrl.SetToolTip("Number of files searched in parallel")
+
         hbox2.Add(label, flag=wx.ALIGN_CENTER_VERTICAL)
         hbox2.AddSpacer(10)
         hbox2.Add(self.searchCtrl, proportion=1)
         hbox2.AddSpacer(10)
+        hbox2.Add(self.regexCheck, flag=wx.ALIGN_CENTER_VERTICAL)
+        hbox2.AddSpacer(10)
+        hbox2.Add(self.filesOnlyCheck, flag=wx.ALIGN_CENTER_VERTICAL)
+        hbox2.AddSpacer(10)
+        hbox2.Add(maxMatchesLabel, flag=wx.ALIGN_CENTER_VERTICAL)
+        hbox2.AddSpacer(5)
+        hbox2.Add(self.maxMatchesCtrl, flag=wx.ALIGN_CENTER_VERTICAL)
+        hbox2.AddSpacer(10)
         hbox2.Add(self.startSearchBtn)
         hbox2.AddSpacer(10)
         hbox2.Add(self.stopSearchBtn)
+        hbox2.AddSpacer(10)
+        hbox2.Add(workersLabel, flag=wx.ALIGN_CENTER_VERTICAL)
+        hbox2.AddSpacer(5)
+        hbox2.Add(self.workersCtrl, flag=wx.ALIGN_CENTER_VERTICAL)
 
         # Progress Bar ------------------------------------------
         hbox3 = wx.BoxSizer(wx.HORIZONTAL)
@@ -351,6 +315,9 @@ class MainPanel(wx.Panel):
 
         # Bind All Events
         self.browseBtn.Bind(wx.EVT_BUTTON, self.onBrowse)
+        self.indexBtn.Bind(wx.EVT_BUTTON, self.onIndexFolder)
+        self.useIndexCheck.Bind(wx.EVT_CHECKBOX, self.onUseIndex)
+        self.updateIndexWatcher()
         self.startSearchBtn.Bind(wx.EVT_BUTTON, self.onStartSearch)
         self.stopSearchBtn.Bind(wx.EVT_BUTTON, self.onStopSearch)
         infoBtn.Bind(wx.EVT_BUTTON, self.onInfo)
@@ -368,7 +335,7 @@ class MainPanel(wx.Panel):
 
     def onItemActivated(self, event):
         index = event.GetIndex()
-        details = self.resultsList.items[index][2]
+        details = self.resultsList.items.details(index)
         self.showDetailsDialog(details)
 
     def showDetailsDialog(self, details):
@@ -409,6 +376,35 @@ class MainPanel(wx.Panel):
             self.dirCtrl.SetValue(self.current_path)
             self.wx_config.Write('/lastpath', self.current_path)
             # HKEY_CURRENT_USER/Software/Evertz/PurrSearch/lastpath
+            self.updateIndexWatcher()
+
+    def onUseIndex(self, event):
+        """User toggled the Search index box."""
+        self.wx_config.WriteBool('/useIndex', self.useIndexCheck.GetValue())
+        self.updateIndexWatcher()
+
+    def updateIndexWatcher(self):
+        """Watch the selected folder for changes while its index is being searched.
+
+        A watcher that is already watching the folder is kept, since starting
+        one walks the whole folder to watch every subfolder.
+        """
+        wanted = (self.useIndexCheck.GetValue() and self.current_path and
+                  has_index(self.current_path) and IndexWatcher.supported())
+        watcher = self.index_watcher
+        if wanted and watcher is not None and watcher.folder == self.current_path and watcher.is_alive():
+            return
+        self.stopIndexWatcher()
+        if wanted:
+            self.index_watcher = IndexWatcher(self.current_path, self.workersCtrl.GetValue())
+            self.index_watcher.start()
+
+    def stopIndexWatcher(self):
+        """Stop the index watcher, waiting for it to finish any change it is making to the index."""
+        if self.index_watcher is not None:
+            self.index_watcher.stop()
+            self.index_watcher.join()
+            self.index_watcher = None
 
     def onInfo(self, event):
         """Showing app details."""
@@ -433,44 +429,6 @@ class MainPanel(wx.Panel):
 
         wx.adv.AboutBox(info)
 
-    def calculateTotalFiles(self, path):
-        total_files = 0
-        file_types = collections.Counter()
-        skipped_formats = ['.jpg', '.db', '.png', '.wbk', '.jpeg', '.pptx', '.shs', '.lnk', '.tmp', '.bmp', '.msg', '.vsd']
-        log_count = 0
-
-        for root, dirs, files in os.walk(path):
-            for file in files:
-                if file.startswith('~$'):  # Skip temporary files
-                    continue
-                file_path = os.path.join(root, file)
-                extension = os.path.splitext(file)[1].lower()
-
-                # Check if it's a log file first
-                if is_log_file(file_path):
-                    total_files += 1
-                    log_count += 1
-                    file_types['log'] += 1
-                elif extension == '.gz' and is_log_file(file_path[:-3]):
-                    total_files += 1
-                    log_count += 1
-                    file_types['log.gz'] += 1
-                elif extension not in skipped_formats:
-                    total_files += 1
-                    file_types[extension] += 1
-
-        self.initial_message = f"Searching in {total_files} files.\nThis may take a while depending on the number of files.\n\n"
-        self.initial_message += "FILES COUNT BY TYPE:"
-
-        for ext, count in file_types.items():
-            self.initial_message += f"\n{ext if ext else 'No extension'}: {count}"
-
-        # Add log file count information
-        if log_count > 0:
-            self.initial_message += f"\n\nTotal log files (including compressed): {log_count}"
-
-        return total_files, self.initial_message
-
     def loadSearchHistory(self):
         """Load search history from the configuration."""
         history = []
@@ -512,6 +470,30 @@ class MainPanel(wx.Panel):
             wx.MessageBox(self.error, "Error", wx.OK | wx.ICON_ERROR)
             return
 
+        # Split the text into terms, or compile it as a regular expression.
+        use_regex = self.regexCheck.GetValue()
+        self.wx_config.WriteBool('/regex', use_regex)
+        files_only = self.filesOnlyCheck.GetValue()
+        self.wx_config.WriteBool('/filesOnly', files_only)
+        max_matches = self.maxMatchesCtrl.GetValue()
+        self.wx_config.WriteInt('/maxMatches', max_matches)
+        pdf_hits = self.pdfHitsCheck.GetValue()
+        self.wx_config.WriteBool('/pdfHits', pdf_hits)
+        try:
+            search_terms = SearchTerms.parse(search_term, regex=use_regex, max_matches=max_matches,
+                                             files_only=files_only, pdf_hits=pdf_hits)
+        except re.error as err:
+            self.error = f"Invalid regular expression: {err}"
+            wx.MessageBox(self.error, "Error", wx.OK | wx.ICON_ERROR)
+            return
+
+        use_index = self.useIndexCheck.GetValue()
+        self.wx_config.WriteBool('/useIndex', use_index)
+        if use_index and not has_index(self.current_path):
+            self.error = "This folder has not been indexed yet. Click Index to build its index first."
+            wx.MessageBox(self.error, "Error", wx.OK | wx.ICON_ERROR)
+            return
+
         # Check if there are results from a previous search
         if self.resultsList.GetItemCount() > 0:
             confirm_dialog = wx.MessageDialog(
@@ -530,10 +512,13 @@ class MainPanel(wx.Panel):
         self.searchCtrl.SetValue(search_term)
 
         self.end_event.clear()
+        # Start with an empty queue; a stopped search may have left messages.
+        self.result_queue = queue.Queue(maxsize=self.RESULT_QUEUE_SIZE)
         self.resultsList.DeleteAllItems()  # Clear previous search results
-        self.resultsList.items = []
+        self.resultsList.items.clear()
         self.resultsList.SetItemCount(0)
         self.resultsCtrl.SetValue("")
+        self.summary_end = 0
         search_term = self.searchCtrl.GetValue()
 
         # Reset the throbber and hide the 'search done' image
@@ -542,22 +527,69 @@ class MainPanel(wx.Panel):
         self.throbber.Start()  # Start the throbber animation
 
         self.searchCtrl.Disable()
+        self.regexCheck.Disable()
+        self.filesOnlyCheck.Disable()
+        self.pdfHitsCheck.Disable()
+        self.maxMatchesCtrl.Disable()
         self.startSearchBtn.Disable()
+        self.indexBtn.Disable()
+        self.workersCtrl.Disable()
 
         # self.statusText = "Status: now searching "
         self.statusLabel.SetLabel(self.statusText)
         self.Layout()
 
+        workers = self.workersCtrl.GetValue()
+        self.wx_config.WriteInt('/workers', workers)
+
         # Start the new search thread
-        self.search_thread = SearchThread(self, self.current_path, search_term, self.result_queue)
+        self.search_thread = SearchThread(self.end_event, self.current_path, search_terms, self.result_queue, workers, use_index)
         self.search_thread.start()
 
         # Start the throbber animation for the new search
         self.throbber.Start()
 
+    def onIndexFolder(self, event):
+        """User clicked Index button, build the full-text index of the folder."""
+        # Check if a search is already in progress
+        if self.search_thread is not None and self.search_thread.is_alive():
+            return
+
+        if not self.dirCtrl.GetValue():
+            self.error = "Please select a folder to index."
+            wx.MessageBox(self.error, "Error", wx.OK | wx.ICON_ERROR)
+            return
+
+        # The index thread takes over keeping the index up to date; a new
+        # watcher is started for the new index once it completes.
+        self.stopIndexWatcher()
+
+        self.end_event.clear()
+        self.result_queue = queue.Queue(maxsize=self.RESULT_QUEUE_SIZE)
+        self.resultsCtrl.SetValue("")
+        self.summary_end = 0
+
+        # Reset the throbber and hide the 'search done' image
+        self.search_done_bitmap.Hide()
+        self.throbber.Show()
+        self.throbber.Start()
+
+        self.searchCtrl.Disable()
+        self.startSearchBtn.Disable()
+        self.indexBtn.Disable()
+        self.workersCtrl.Disable()
+        self.Layout()
+
+        workers = self.workersCtrl.GetValue()
+        self.wx_config.WriteInt('/workers', workers)
+
+        # Start the indexing thread; it reports through result_queue like a search.
+        self.search_thread = IndexThread(self.end_event, self.current_path, self.result_queue, workers)
+        self.search_thread.start()
+
     def onStopSearch(self, event):
-        if not self.end_event.is_set():
-            self.end_event.set()
+        if not self.end_event.cancelled:
+            self.end_event.cancel()
             self.statusText = "Status: Stopping..."
             # self.progressLabel.SetLabel(self.statusText)
             self.statusLabel.SetLabel(self.statusText)
@@ -567,9 +599,16 @@ class MainPanel(wx.Panel):
                 self.search_thread.stop()
                 self.statusText = "Status: Search Stopped"
                 self.statusLabel.SetLabel(self.statusText)
-            self.end_event=threading.Event()
+            self.end_event = CancelToken()
+            self.updateIndexWatcher()  # In case indexing was stopped.
         self.searchCtrl.Enable()
+        self.regexCheck.Enable()
+        self.filesOnlyCheck.Enable()
+        self.pdfHitsCheck.Enable()
+        self.maxMatchesCtrl.Enable()
         self.startSearchBtn.Enable()
+        self.indexBtn.Enable()
+        self.workersCtrl.Enable()
         self.exportBtn.Enable()
         self.throbber.Stop()
         # self.search_thread = None
@@ -584,9 +623,18 @@ class MainPanel(wx.Panel):
         self.stopSearchBtn.Disable()
         self.startSearchBtn.Enable()
         self.throbber.Stop()
+        indexed = isinstance(self.search_thread, IndexThread)
         self.search_thread = None
+        if indexed:
+            self.updateIndexWatcher()  # Watch the new index.
         self.searchCtrl.Enable()
+        self.regexCheck.Enable()
+        self.filesOnlyCheck.Enable()
+        self.pdfHitsCheck.Enable()
+        self.maxMatchesCtrl.Enable()
         self.startSearchBtn.Enable()
+        self.indexBtn.Enable()
+        self.workersCtrl.Enable()
         self.exportBtn.Enable()
 
     def onTimer(self, event: wx.TimerEvent):
@@ -596,18 +644,34 @@ class MainPanel(wx.Panel):
                 self.stopSearchBtn.Enable()
                 self.startSearchBtn.Disable()
                 self.browseBtn.Disable()
+                self.indexBtn.Disable()
                 self.exportBtn.Disable()
             else:
                 self.stopSearchBtn.Disable()
                 # if self.end_event.is_set():
                 self.startSearchBtn.Enable()
                 self.browseBtn.Enable()
+                self.indexBtn.Enable()
                 self.exportBtn.Enable()
 
-            while not self.result_queue.empty():
-                item = self.result_queue.get()
+            # Handle the messages within a time and count budget, so a busy
+            # search can't freeze the window; the rest wait for the next tick.
+            deadline = time.perf_counter() + self.DRAIN_TIME
+            for _ in range(self.DRAIN_ITEMS):
+                if time.perf_counter() > deadline:
+                    break
+                try:
+                    item = self.result_queue.get_nowait()
+                except queue.Empty:
+                    break
                 if item[0] == 'status':
                     self.resultsCtrl.AppendText(item[1])
+                elif item[0] == 'summary':
+                    # Replace the file count summary at the top of the results
+                    # text; positions are measured by the control itself.
+                    before = self.resultsCtrl.GetLastPosition()
+                    self.resultsCtrl.Replace(0, self.summary_end, item[1])
+                    self.summary_end += self.resultsCtrl.GetLastPosition() - before
                 elif item[0] == 'status_bar':
                     self.statusLabel.SetLabel(item[1])
                 elif item[0] == 'progress':
@@ -625,8 +689,9 @@ class MainPanel(wx.Panel):
 
                         self.progressLabel.SetLabel("Search Complete!")  # Update label to show it's done
 
-                elif item[0] == 'result':
-                    self.resultsList.items.append((item[1], str(item[2]), item[3], item[4]))
+                elif item[0] == 'results':
+                    # A batch of results; the virtual list is resized once.
+                    self.resultsList.items.extend(item[1])
                     self.resultsList.SetItemCount(len(self.resultsList.items))
                 elif item[0] == 'error':
                     self.resultsCtrl.AppendText(item[1])
@@ -637,6 +702,7 @@ class MainPanel(wx.Panel):
             self.stopSearchBtn.Disable()
             self.startSearchBtn.Enable()
             self.browseBtn.Enable()
+            self.indexBtn.Enable()
 
             if self.resultsList.GetItemCount() > 0:
                 self.exportBtn.Enable()
@@ -649,6 +715,8 @@ class MainPanel(wx.Panel):
         if self.search_thread is None or not self.search_thread.is_alive():
             # No search has been performed or no results are present, close without confirmation
             self.timer.Stop()
+            if self.index_watcher is not None:
+                self.index_watcher.stop()
             event.Skip()  # Allow the window to close
             self.Destroy()  # Close the window directly
         else:
@@ -660,10 +728,12 @@ class MainPanel(wx.Panel):
                 return
             else:
                 # Ensure that the search thread is stopped before closing
-                self.end_event.set()
+                self.end_event.cancel()
                 if self.search_thread is not None:
                     self.search_thread.join()  # Wait for the thread to finish
             self.timer.Stop()
+            if self.index_watcher is not None:
+                self.index_watcher.stop()
             event.Skip()  # Allow the window to close
 
     def exportResultsToExcel(self, filepath):
@@ -816,6 +886,8 @@ class SearchGUI(wx.Frame):
         self.Bind(wx.EVT_CLOSE, self.panel.onClose) ###
 
 if __name__ == "__main__":
+    # Required for the search worker processes in a frozen (PyInstaller) build.
+    multiprocessing.freeze_support()
     import wx.lib.mixins.inspection as wit
     app = wit.InspectableApp(redirect=False)
     locale.setlocale(locale.LC_ALL, 'C')
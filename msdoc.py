@@ -0,0 +1,151 @@
+"""Text extraction from Word 97-2003 (.doc, .dot) binary documents.
+
+A .doc file is an OLE compound file.  Its text is stored in the
+WordDocument stream as a series of pieces, each either 8-bit (cp1252) or
+UTF-16 text, and the piece table in the 0Table or 1Table stream says where
+each piece is and where it goes in the document.  Only those two streams
+are read; pictures, embedded objects and the rest of the file aren't
+touched.  See [MS-DOC] for the format.
+
+Word 95 and older documents, encrypted documents and files that are really
+RTF or HTML saved with a .doc extension raise ValueError.
+"""
+import re
+import struct
+
+import olefile  # pip install olefile
+
+# The stories of a document, in the order their text follows the main
+# document, with the index of their character count in FibRgLw97.  Index 6
+# (macro text) is unused.
+STORIES = (('', 3), ('Footnotes', 4), ('Headers', 5), ('Comments', 7), ('Endnotes', 8),
+           ('Text boxes', 9), ('Header text boxes', 10))
+# The oldest version of the format that uses a piece table (Word 97).
+MIN_FIB_VERSION = 0xC0
+# FibBase flags.
+F_ENCRYPTED = 0x0100
+F_WHICH_TABLE_STREAM = 0x0200
+# Index of the fcClx/lcbClx pair in FibRgFcLcb97.
+CLX_INDEX = 33
+# The bytes of 8-bit pieces that aren't Latin-1, from [MS-DOC] 2.4.1.
+COMPRESSED_CHARS = {byte: bytes([byte]).decode('cp1252')
+                    for byte in (*range(0x82, 0x8D), *range(0x91, 0x9D), 0x9F)}
+NOT_LATIN_1 = re.compile(b'[\x82-\x8c\x91-\x9c\x9f]')
+# Paragraph marks, cell and row marks, and section and page breaks.
+PARAGRAPH_END = re.compile('[\r\x07\x0c]')
+FIELD_MARKS = re.compile('([\x13\x14\x15])')
+# Special characters that stand for something other than text, such as
+# pictures, footnote references and optional hyphens.
+SPECIAL_CHARS = re.compile('[\x01-\x06\x08\x0f-\x1d\x1f]')
+
+
+def piece_table(clx):
+    """Return the character positions and piece descriptors of a Clx structure."""
+    pos = 0
+    while pos < len(clx):
+        if clx[pos] == 0x01:  # Prc: formatting, skipped.
+            pos += 3 + struct.unpack_from('<H', clx, pos + 1)[0]
+        elif clx[pos] == 0x02:  # Pcdt: the piece table.
+            size = struct.unpack_from('<I', clx, pos + 1)[0]
+            plc = clx[pos + 5:pos + 5 + size]
+            count = (len(plc) - 4) // 12
+            positions = struct.unpack_from(f'<{count + 1}I', plc)
+            descriptors = [plc[4 * (count + 1) + 8 * i:4 * (count + 1) + 8 * (i + 1)] for i in range(count)]
+            return positions, descriptors
+        else:
+            break
+    raise ValueError("No piece table in the document")
+
+
+def document_text(file_path):
+    """Return the text of a Word 97-2003 document and the length of each of its stories."""
+    try:
+        return read_document_text(file_path)
+    except struct.error as err:
+        raise ValueError(f"Damaged document: {err}") from err
+
+
+def read_document_text(file_path):
+    """Do the work of document_text(), which turns a struct.error from a damaged file into ValueError."""
+    if not olefile.isOleFile(file_path):
+        raise ValueError("Not an OLE compound file")
+    with olefile.OleFileIO(file_path) as ole:
+        if not ole.exists('WordDocument'):
+            raise ValueError("No WordDocument stream")
+        document = ole.openstream('WordDocument').read()
+        ident, version = struct.unpack_from('<HH', document)
+        flags = struct.unpack_from('<H', document, 0x0A)[0]
+        if ident != 0xA5EC or version < MIN_FIB_VERSION:
+            raise ValueError("Not a Word 97-2003 document")
+        if flags & F_ENCRYPTED:
+            raise ValueError("The document is encrypted")
+        table_name = '1Table' if flags & F_WHICH_TABLE_STREAM else '0Table'
+        if not ole.exists(table_name):
+            raise ValueError(f"No {table_name} stream")
+        table = ole.openstream(table_name).read()
+
+    # FibBase is followed by FibRgW97, FibRgLw97 and FibRgFcLcb, each after its length.
+    word_count = struct.unpack_from('<H', document, 0x20)[0]
+    long_start = 0x22 + 2 * word_count + 2
+    long_count = struct.unpack_from('<H', document, long_start - 2)[0]
+    longs = struct.unpack_from(f'<{long_count}i', document, long_start)
+    fc_start = long_start + 4 * long_count + 2
+    fc_clx, lcb_clx = struct.unpack_from('<II', document, fc_start + 8 * CLX_INDEX)
+
+    positions, descriptors = piece_table(table[fc_clx:fc_clx + lcb_clx])
+    pieces = []
+    for start, end, descriptor in zip(positions, positions[1:], descriptors):
+        fc = struct.unpack_from('<I', descriptor, 2)[0]
+        if fc & 0x40000000:  # 8-bit text, at half the offset.
+            offset = (fc & 0x3FFFFFFF) // 2
+            data = document[offset:offset + end - start]
+            piece = data.decode('latin-1')
+            pieces.append(piece.translate(COMPRESSED_CHARS) if NOT_LATIN_1.search(data) else piece)
+        else:
+            pieces.append(document[fc:fc + 2 * (end - start)].decode('utf-16-le', 'replace'))
+    lengths = [(name, max(longs[index], 0)) for name, index in STORIES]
+    return ''.join(pieces), lengths
+
+
+def strip_fields(text):
+    """Remove the field codes from text, keeping each field's result."""
+    if '\x13' not in text:
+        return text
+    kept = []
+    fields = []  # For each open field, True while in its code.
+    for part in FIELD_MARKS.split(text):
+        if part == '\x13':
+            fields.append(True)
+        elif part == '\x14':
+            if fields:
+                fields[-1] = False
+        elif part == '\x15':
+            if fields:
+                fields.pop()
+        elif not any(fields):
+            kept.append(part)
+    return ''.join(kept)
+
+
+def plain_text(text):
+    """Remove the special characters from text, turning line and column breaks into newlines."""
+    text = SPECIAL_CHARS.sub('', text)
+    # Line and column breaks, and non-breaking hyphens.
+    return text.replace('\x0b', '\n').replace('\x0e', '\n').replace('\x1e', '-')
+
+
+def doc_paragraphs(file_path):
+    """Return the (story, paragraphs) of a Word 97-2003 document, the main document first.
+
+    The story is '' for the main document, or a name such as 'Footnotes'.
+    Each table cell is a paragraph of its own.
+    """
+    text, lengths = document_text(file_path)
+    stories = []
+    start = 0
+    for name, length in lengths:
+        if length:
+            story = plain_text(strip_fields(text[start:start + length]))
+            stories.append((name, [paragraph.strip() for paragraph in PARAGRAPH_END.split(story)]))
+        start += length
+    return stories
@@ -0,0 +1,543 @@
+"""Streaming text extraction from Office Open XML (.docx, .docm, .xlsx, .vsdx) files.
+
+python-docx, docx2python, openpyxl and vsdx build an object for every
+paragraph, run, cell and shape of a document (docx2python also unpacks its
+images), which takes far more time and memory than finding text needs.  The
+functions here read the XML parts straight out of the zip package with an
+expat (SAX) parser, a block at a time, keeping only the text and location
+of the current paragraph, cell or shape, so even a very large workbook or
+drawing is read with little memory.
+
+Paragraphs are numbered and cells given the same coordinates and values as
+those libraries gave them, so the search results don't change.
+"""
+import posixpath
+import re
+import zipfile
+from xml.parsers import expat
+
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+from openpyxl.utils.cell import coordinate_to_tuple, get_column_letter
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, from_excel, from_ISO8601, WINDOWS_EPOCH
+
+# Namespaces, as the parser joins them to element and attribute names.
+WORD_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main '
+SHEET_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main '
+RELS_NS = 'http://schemas.openxmlformats.org/package/2006/relationships '
+DOC_RELS_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships '
+VISIO_NS = 'http://schemas.microsoft.com/office/visio/2012/main '
+
+# Number of bytes of an XML part parsed at a time.
+XML_BLOCK_SIZE = 1024 * 1024
+# Excel's escapes for characters XML can't hold, such as _x000D_ for a carriage return.
+ESCAPED_CHAR = re.compile(r'_x([0-9A-Fa-f]{4})_')
+
+
+def refuse_entities(*args):
+    """Stop parsing a part that declares or references entities.
+
+    Office documents never use them; this guards against XML bombs and
+    against documents that pull in other files, like defusedxml does.
+    """
+    raise ValueError("XML entities are not allowed in Office documents")
+
+def parse(part, start=None, end=None, characters=None, found=None):
+    """Parse an XML part a block at a time, calling the handlers for it.
+
+    start(name, attrs), end(name) and characters(text) are expat's handlers,
+    with names given as "namespace local-name".  If found is a list, the
+    handlers add their results to it and this yields them after each block,
+    so the caller can stop reading part way through.
+    """
+    parser = expat.ParserCreate(namespace_separator=' ')
+    parser.buffer_text = True
+    parser.EntityDeclHandler = refuse_entities
+    parser.ExternalEntityRefHandler = refuse_entities
+    if start is not None:
+        parser.StartElementHandler = start
+    if end is not None:
+        parser.EndElementHandler = end
+    if characters is not None:
+        parser.CharacterDataHandler = characters
+    while True:
+        block = part.read(XML_BLOCK_SIZE)
+        parser.Parse(block, not block)
+        if found:
+            yield from found
+            found.clear()
+        if not block:
+            break
+
+def parse_all(part, start=None, end=None, characters=None):
+    """Parse a whole XML part, for handlers that keep their own results."""
+    for _ in parse(part, start, end, characters):
+        pass
+
+
+def relationships(package, part_name):
+    """Return the {id: (type, part name)} relationships of a part in a package."""
+    folder, name = posixpath.split(part_name)
+    rels_name = posixpath.join(folder, '_rels', name + '.rels')
+    rels = {}
+    def start(name, attrs):
+        if name == RELS_NS + 'Relationship' and attrs.get('TargetMode') != 'External':
+            target = attrs['Target']
+            if target.startswith('/'):
+                target = target[1:]
+            else:
+                target = posixpath.normpath(posixpath.join(folder, target))
+            rels[attrs['Id']] = (attrs['Type'], target)
+    if rels_name in package.NameToInfo:
+        with package.open(rels_name) as part:
+            parse_all(part, start)
+    return rels
+
+def main_part(package, default):
+    """Return the name of the main document part of a package."""
+    for rel_type, target in relationships(package, '').values():
+        if rel_type.endswith('/officeDocument'):
+            return target
+    return default
+
+
+# .docx, .docm
+def docx_paragraphs(file_path, nested=False):
+    """Yield the text of each paragraph of a Word document in order.
+
+    By default these are the paragraphs directly in the body of the
+    document, as python-docx's Document.paragraphs lists them.  With nested,
+    the paragraphs in tables and text boxes are included too, as docx2python
+    reads them; a text box's paragraphs come before the paragraph it's in.
+    """
+    body, paragraph, text = WORD_NS + 'body', WORD_NS + 'p', WORD_NS + 't'
+    tab, line_break, carriage_return = WORD_NS + 'tab', WORD_NS + 'br', WORD_NS + 'cr'
+    tab_position, break_type = WORD_NS + 'val', WORD_NS + 'type'
+    found = []
+    pieces = []  # The text read so far of each open paragraph, innermost last.
+    depths = []  # How deep in the document each open paragraph is.
+    depth = body_depth = 0
+    in_text = False
+
+    def start(name, attrs):
+        nonlocal depth, body_depth, in_text
+        depth += 1
+        if name == paragraph:
+            pieces.append([])
+            depths.append(depth)
+        elif not pieces:
+            if name == body:
+                body_depth = depth
+        elif name == text:
+            in_text = True
+        elif name == tab:
+            # Tab stops in the paragraph properties have a position, not a character.
+            if tab_position not in attrs:
+                pieces[-1].append('\t')
+        elif name == carriage_return or (name == line_break and
+                                         attrs.get(break_type, 'textWrapping') == 'textWrapping'):
+            pieces[-1].append('\n')
+
+    def end(name):
+        nonlocal depth, in_text
+        depth -= 1
+        if name == text:
+            in_text = False
+        elif name == paragraph:
+            paragraph_pieces = pieces.pop()
+            paragraph_depth = depths.pop()
+            if nested or paragraph_depth == body_depth + 1:
+                found.append(''.join(paragraph_pieces))
+
+    def characters(data):
+        if in_text:
+            pieces[-1].append(data)
+
+    with zipfile.ZipFile(file_path) as package:
+        with package.open(main_part(package, 'word/document.xml')) as part:
+            yield from parse(part, start, end, characters, found)
+
+
+# .xlsx
+def unescape(text):
+    """Replace Excel's _xHHHH_ escapes in a string with the characters they stand for."""
+    if '_x' not in text:
+        return text
+    return ESCAPED_CHAR.sub(lambda match: chr(int(match.group(1), 16)), text)
+
+def cast_number(value):
+    """Return a number from a sheet as an int or float, as openpyxl does."""
+    if '.' in value or 'E' in value or 'e' in value:
+        return float(value)
+    return int(value)
+
+
+class StringReader:
+    """Handlers that collect the plain text of shared or inline strings.
+
+    The text of the <t> elements in a string is joined, leaving out the
+    phonetic guides (<rPh>) that Japanese workbooks add.
+    """
+    def __init__(self):
+        self.pieces = []
+        self.in_text = False
+        self.phonetic = 0
+
+    def start(self, name, attrs):
+        if name == SHEET_NS + 't':
+            self.in_text = not self.phonetic
+        elif name == SHEET_NS + 'rPh':
+            self.phonetic += 1
+
+    def end(self, name):
+        if name == SHEET_NS + 't':
+            self.in_text = False
+        elif name == SHEET_NS + 'rPh':
+            self.phonetic -= 1
+
+    def characters(self, data):
+        if self.in_text:
+            self.pieces.append(data)
+
+    def text(self):
+        """Return the text collected so far, and start on the next string."""
+        text = ''.join(self.pieces)
+        self.pieces.clear()
+        return text
+
+
+def shared_strings(package, part_name):
+    """Return the shared string table of a workbook as a list.
+
+    Unlike openpyxl, this decodes the _xHHHH_ escapes Excel writes for
+    characters such as carriage returns, so they are searched as they show.
+    """
+    strings = []
+    if part_name is None or part_name not in package.NameToInfo:
+        return strings
+    reader = StringReader()
+    def end(name):
+        if name == SHEET_NS + 'si':
+            strings.append(unescape(reader.text()))
+        else:
+            reader.end(name)
+    with package.open(part_name) as part:
+        parse_all(part, reader.start, end, reader.characters)
+    return strings
+
+def date_styles(package, part_name):
+    """Return the sets of cell styles that format numbers as dates, and as durations."""
+    dates, durations = set(), set()
+    if part_name is None or part_name not in package.NameToInfo:
+        return dates, durations
+    formats = dict(BUILTIN_FORMATS)
+    styles = []  # The number format of each cell style.
+    in_cell_styles = False
+    def start(name, attrs):
+        nonlocal in_cell_styles
+        if name == SHEET_NS + 'numFmt':
+            formats[int(attrs['numFmtId'])] = attrs.get('formatCode')
+        elif name == SHEET_NS + 'cellXfs':
+            in_cell_styles = True
+        elif name == SHEET_NS + 'xf' and in_cell_styles:
+            styles.append(int(attrs.get('numFmtId', 0)))
+    def end(name):
+        nonlocal in_cell_styles
+        if name == SHEET_NS + 'cellXfs':
+            in_cell_styles = False
+    with package.open(part_name) as part:
+        parse_all(part, start, end)
+    for style, format_id in enumerate(styles):
+        number_format = formats.get(format_id)
+        if is_date_format(number_format):
+            dates.add(style)
+        if is_timedelta_format(number_format):
+            durations.add(style)
+    return dates, durations
+
+
+class Workbook:
+    """The sheets and shared strings of an .xlsx file, read without loading its cells."""
+    def __init__(self, file_path):
+        self.package = zipfile.ZipFile(file_path)
+        try:
+            self.part_name = main_part(self.package, 'xl/workbook.xml')
+            rels = relationships(self.package, self.part_name)
+            self.epoch = WINDOWS_EPOCH
+            # The (name, part name) of each worksheet in order; chart sheets have no cells.
+            self.sheets = []
+            def start(name, attrs):
+                if name == SHEET_NS + 'workbookPr':
+                    if attrs.get('date1904') in ('1', 'true'):
+                        self.epoch = CALENDAR_MAC_1904
+                elif name == SHEET_NS + 'sheet':
+                    rel_type, target = rels.get(attrs.get(DOC_RELS_NS + 'id'), ('', None))
+                    if rel_type.endswith('/worksheet'):
+                        self.sheets.append((attrs['name'], target))
+            with self.package.open(self.part_name) as part:
+                parse_all(part, start)
+            parts = {rel_type.rsplit('/', 1)[-1]: target for rel_type, target in rels.values()}
+            self.strings_part = parts.get('sharedStrings')
+            self.styles_part = parts.get('styles')
+            self._strings = None
+            self._date_styles = None
+        except Exception:
+            self.package.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.package.close()
+
+    @property
+    def strings(self):
+        """The shared string table, read the first time it's needed."""
+        if self._strings is None:
+            self._strings = shared_strings(self.package, self.strings_part)
+        return self._strings
+
+    @property
+    def date_styles(self):
+        if self._date_styles is None:
+            self._date_styles = date_styles(self.package, self.styles_part)
+        return self._date_styles
+
+    def number_value(self, value, style):
+        """Return the value openpyxl gives a number cell with a style."""
+        value = cast_number(value)
+        dates, durations = self.date_styles
+        if style in dates:
+            try:
+                value = from_excel(value, self.epoch, timedelta=style in durations)
+            except (OverflowError, ValueError):
+                value = "#VALUE!"
+        return value
+
+    def cell_value(self, data_type, value, style):
+        """Return the value openpyxl gives a cell, from its type, <v> text and style."""
+        if data_type == 's':
+            return self.strings[int(value)]
+        elif data_type == 'n':
+            return self.number_value(value, int(style)) if style else cast_number(value)
+        elif data_type == 'b':
+            return bool(int(value))
+        elif data_type == 'd':
+            return from_ISO8601(value)
+        return value  # A formula's string result, or an error such as #N/A.
+
+    def cells(self, part_name, wanted_strings=None, numbers=True):
+        """Yield the (coordinate, value) of each cell of a sheet that has a value.
+
+        The values are those openpyxl gives in data_only mode: formula cells
+        have the value Excel last calculated for them, if any.  If
+        wanted_strings is a set of indexes into the shared string table, the
+        cells holding any other shared string are skipped without looking
+        the string up.  Without numbers, number, date and boolean cells are
+        skipped too.
+        """
+        cell_tag, row_tag, value_tag = SHEET_NS + 'c', SHEET_NS + 'row', SHEET_NS + 'v'
+        inline_tag = SHEET_NS + 'is'
+        found = []
+        inline = StringReader()
+        value = []  # The text of the current cell's <v>.
+        inline_text = None  # The text of the current cell's inline string, once read.
+        cell = None  # The attributes of the current cell.
+        row = 0  # Number of the current row.
+        column = None  # Column of the last cell read, if it had to be worked out.
+        coordinate = None
+        in_value = in_inline = False
+
+        def start(name, attrs):
+            nonlocal cell, row, column, coordinate, inline_text, in_value, in_inline
+            if name == cell_tag:
+                cell = attrs
+                value.clear()
+                inline_text = None
+                if 'r' in attrs:
+                    coordinate = attrs['r']
+                    column = None
+                else:
+                    # A cell without a reference follows the one before it in its row.
+                    if column is None:
+                        column = coordinate_to_tuple(coordinate)[1] if coordinate else 0
+                    column += 1
+                    coordinate = cell['r'] = f"{get_column_letter(column)}{row}"
+            elif name == value_tag:
+                in_value = True
+            elif name == row_tag:
+                row = int(attrs['r']) if 'r' in attrs else row + 1
+                column = coordinate = None
+            elif name == inline_tag:
+                in_inline = True
+            elif in_inline:
+                inline.start(name, attrs)
+
+        def end(name):
+            nonlocal inline_text, in_value, in_inline
+            if name == cell_tag:
+                data_type = cell.get('t', 'n')
+                if data_type == 'inlineStr':
+                    if inline_text is not None:
+                        found.append((cell['r'], inline_text))
+                elif value:
+                    text = ''.join(value)
+                    if not text:
+                        pass
+                    elif data_type == 's' and wanted_strings is not None:
+                        index = int(text)
+                        if index in wanted_strings:
+                            found.append((cell['r'], self.strings[index]))
+                    elif numbers or data_type not in ('n', 'b', 'd'):
+                        found.append((cell['r'], self.cell_value(data_type, text, cell.get('s'))))
+            elif name == value_tag:
+                in_value = False
+            elif name == inline_tag:
+                in_inline = False
+                inline_text = inline.text()
+            elif in_inline:
+                inline.end(name)
+
+        def characters(data):
+            if in_value:
+                value.append(data)
+            elif in_inline:
+                inline.characters(data)
+
+        with self.package.open(part_name) as part:
+            yield from parse(part, start, end, characters, found)
+
+
+# .vsdx
+def visio_parts(package, part_name, tag):
+    """Return the (attributes, part name) of each <Page> or <Master> listed in a Visio part."""
+    rels = relationships(package, part_name)
+    parts = []
+    listed = None  # The attributes of the page or master being read.
+    def start(name, attrs):
+        nonlocal listed
+        if name == VISIO_NS + tag:
+            listed = attrs
+        elif name == VISIO_NS + 'Rel' and listed is not None:
+            rel = rels.get(attrs.get(DOC_RELS_NS + 'id'))
+            if rel is not None:
+                parts.append((listed, rel[1]))
+            listed = None
+    if part_name in package.NameToInfo:
+        with package.open(part_name) as part:
+            parse_all(part, start)
+    return parts
+
+def visio_shapes(part, master_text=None):
+    """Yield (depth, shape ID, text) for each shape in a Visio page or master part.
+
+    A group comes before the shapes in it, as it does in the drawing; depth
+    is 1 for the shapes directly on the page.  A shape without text of its
+    own shows the text of its master shape, given by
+    master_text(master ID, master shape ID), as vsdx's Shape.text does.
+    """
+    shape_tag, shapes_tag, text_tag = VISIO_NS + 'Shape', VISIO_NS + 'Shapes', VISIO_NS + 'Text'
+    found = []
+    open_shapes = []  # The open shapes, innermost last.
+    in_text = False
+
+    def finish(shape):
+        """Add a shape to found, once its own text has been read or can't come any more."""
+        if shape['done']:
+            return
+        shape['done'] = True
+        if shape['text'] is not None:
+            text = ''.join(shape['text'])
+        elif shape['master'] is not None and master_text is not None:
+            text = master_text(shape['master'], shape['master_shape'])
+        else:
+            text = ''
+        found.append((len(open_shapes), shape['id'], text))
+
+    def start(name, attrs):
+        nonlocal in_text
+        if name == shape_tag:
+            # The shapes in a group are instances of the group's master.
+            master = attrs.get('Master') or (open_shapes[-1]['master'] if open_shapes else None)
+            open_shapes.append({'id': attrs.get('ID'), 'master': master, 'master_shape': attrs.get('MasterShape'),
+                                'text': None, 'done': False})
+        elif not open_shapes:
+            pass
+        elif name == text_tag:
+            in_text = True
+            open_shapes[-1]['text'] = []
+        elif name == shapes_tag:
+            finish(open_shapes[-1])  # A group's text comes before the shapes in it.
+
+    def end(name):
+        nonlocal in_text
+        if name == text_tag and in_text:
+            in_text = False
+            finish(open_shapes[-1])
+        elif name == shape_tag:
+            finish(open_shapes[-1])
+            open_shapes.pop()
+
+    def characters(data):
+        if in_text:
+            open_shapes[-1]['text'].append(data)
+
+    yield from parse(part, start, end, characters, found)
+
+
+class Drawing:
+    """The pages and masters of a Visio (.vsdx) drawing, read without loading their shapes."""
+    def __init__(self, file_path):
+        self.package = zipfile.ZipFile(file_path)
+        try:
+            document = main_part(self.package, 'visio/document.xml')
+            parts = {rel_type.rsplit('/', 1)[-1]: target
+                     for rel_type, target in relationships(self.package, document).values()}
+            # The (name, part name) of each page in order, named as Visio shows them.
+            self.pages = [(attrs.get('NameU') or attrs.get('Name') or f"Page-{index + 1}", part_name)
+                          for index, (attrs, part_name)
+                          in enumerate(visio_parts(self.package, parts.get('pages', 'visio/pages/pages.xml'), 'Page'))]
+            self.masters_part = parts.get('masters')
+            self._master_texts = None
+        except Exception:
+            self.package.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.package.close()
+
+    @property
+    def master_texts(self):
+        """The {(master ID, shape ID): text} of the master shapes, read the first time they're needed.
+
+        (master ID, None) is the text of the master's top shape.
+        """
+        if self._master_texts is None:
+            self._master_texts = {}
+            for attrs, part_name in visio_parts(self.package, self.masters_part, 'Master'):
+                master_id = attrs.get('ID')
+                with self.package.open(part_name) as part:
+                    for depth, shape_id, text in visio_shapes(part):
+                        self._master_texts[master_id, shape_id] = text
+                        if depth == 1:
+                            self._master_texts.setdefault((master_id, None), text)
+        return self._master_texts
+
+    def master_text(self, master_id, shape_id):
+        return self.master_texts.get((master_id, shape_id), '')
+
+    def shapes(self, part_name):
+        """Yield the (shape ID, text) of each shape with text on a page."""
+        with self.package.open(part_name) as part:
+            for depth, shape_id, text in visio_shapes(part, self.master_text):
+                if text:
+                    yield shape_id, text
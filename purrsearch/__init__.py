@@ -0,0 +1,5 @@
+"""Command line interface to the PurrSearch search engine.
+
+Run it with "python -m purrsearch" from the folder that holds PurrSearch.py;
+see purrsearch.__main__ for the commands.  Nothing here imports wxPython.
+"""
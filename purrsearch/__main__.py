@@ -0,0 +1,182 @@
+"""Search (or index) a folder from the command line, without the GUI.
+
+    python -m purrsearch search PATH TERM [TERM ...] [--regex] [--index] [--max-matches N]
+                                [--files-only] [--pdf-hits] [--workers N]
+    python -m purrsearch index PATH [--workers N]
+
+Results are written to stdout as JSON Lines as soon as they are found, one
+object per line with a "type" of "result", "error" or "complete":
+
+    {"type": "result", "file": "a.log", "path": "/logs/a.log", "matches": 2, "details": ["Line 3: ...", ...]}
+    {"type": "error", "message": "Error processing /logs/b.pdf: ..."}
+    {"type": "complete", "files_with_matches": 1, "elapsed": 0.42}
+
+Like grep, the exit status is 0 if any file matched, 1 if none did and 2 if
+the search couldn't be run.  Indexing exits with 0 on success.
+"""
+import argparse
+import json
+import os
+import queue
+import re
+import sys
+import time
+
+# The search engine is imported by the commands, once stdout has been
+# redirected (see redirect_stdout()), as PyMuPDF may print warnings to
+# stdout when it is loaded.
+
+EXIT_MATCH = 0
+EXIT_NO_MATCH = 1
+EXIT_ERROR = 2
+EXIT_INTERRUPTED = 130
+
+# Where the JSON Lines records go; see redirect_stdout().
+output = sys.stdout
+
+
+def redirect_stdout():
+    """Keep stdout for the JSON records alone.
+
+    The extractors print their diagnostics, so the real stdout is duplicated
+    for the records and file descriptor 1 is pointed at stderr; the search
+    worker processes inherit the redirected descriptor.  It must be called
+    before the search engine is imported.
+    """
+    global output
+    sys.stdout.flush()
+    output = os.fdopen(os.dup(sys.stdout.fileno()), 'w', encoding='utf-8')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+
+def write_json(record):
+    """Write one JSON Lines record to stdout."""
+    output.write(json.dumps(record, ensure_ascii=False) + '\n')
+    output.flush()
+
+
+def write_error(file_path, error):
+    write_json({'type': 'error', 'message': f"Error processing {file_path}: {error}"})
+
+
+def run_thread(thread, result_queue, end_event):
+    """Run an index thread, writing its errors to stdout.
+
+    Returns False if the thread ended without completing (it failed, or was
+    interrupted).
+    """
+    completed = False
+    thread.start()
+    try:
+        while True:
+            try:
+                item = result_queue.get(timeout=0.1)
+            except queue.Empty:
+                if not thread.is_alive() and result_queue.empty():
+                    break
+                continue
+            if item[0] == 'error':
+                write_json({'type': 'error', 'message': item[1].strip()})
+            elif item[0] == 'complete':
+                completed = True
+                break
+    except KeyboardInterrupt:
+        end_event.set()
+        thread.join()
+        raise
+    thread.join()
+    return completed
+
+
+def search(args):
+    """The search command."""
+    from search_engine import CancelToken, Search
+    from search_functions import count_matches, SearchTerms
+    from search_index import has_index
+
+    try:
+        if args.regex:
+            if len(args.terms) != 1:
+                print("--regex takes a single regular expression", file=sys.stderr)
+                return EXIT_ERROR
+            terms = SearchTerms(args.terms[0], regex=True, max_matches=args.max_matches,
+                                files_only=args.files_only, pdf_hits=args.pdf_hits)
+        else:
+            terms = SearchTerms(args.terms, max_matches=args.max_matches, files_only=args.files_only,
+                                pdf_hits=args.pdf_hits)
+    except re.error as err:
+        print(f"Invalid regular expression: {err}", file=sys.stderr)
+        return EXIT_ERROR
+    if terms.empty:
+        print("Nothing to search for", file=sys.stderr)
+        return EXIT_ERROR
+    if args.index and not has_index(args.path):
+        print(f"{args.path} has not been indexed, run: python -m purrsearch index PATH", file=sys.stderr)
+        return EXIT_ERROR
+
+    token = CancelToken()
+    search = Search(args.path, terms, token, args.workers, args.index, on_error=write_error)
+    try:
+        for file_path, matches in search:
+            write_json({'type': 'result', 'file': os.path.basename(file_path), 'path': file_path,
+                        'matches': count_matches(matches), 'details': matches})
+    except KeyboardInterrupt:
+        token.cancel()
+        raise
+    except Exception as err:
+        write_json({'type': 'error', 'message': f"Search failed with error: {err}"})
+        return EXIT_ERROR
+    write_json({'type': 'complete', 'files_with_matches': search.files_with_matches,
+                'elapsed': round(search.elapsed, 3)})
+    return EXIT_MATCH if search.files_with_matches else EXIT_NO_MATCH
+
+
+def index(args):
+    """The index command."""
+    from search_engine import CancelToken, IndexThread
+
+    start_time = time.time()
+    token = CancelToken()
+    result_queue = queue.Queue()
+    thread = IndexThread(token, args.path, result_queue, args.workers)
+    if not run_thread(thread, result_queue, token):
+        return EXIT_ERROR
+    write_json({'type': 'complete', 'elapsed': round(time.time() - start_time, 3)})
+    return EXIT_MATCH
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='purrsearch', description="Search files in a folder for text.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    # Options shared by every command.
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--workers', type=int,
+                        help="number of files to read in parallel (default: one per CPU)")
+
+    search_parser = commands.add_parser('search', parents=[common], help="search the files in a folder")
+    search_parser.add_argument('path', help="folder to search, including its subfolders")
+    search_parser.add_argument('terms', nargs='+', metavar='term', help="text to search for; a file matches if it contains any term")
+    search_parser.add_argument('--regex', action='store_true', help="treat the term as a regular expression")
+    search_parser.add_argument('--index', action='store_true', help="search the folder's index instead of its files")
+    search_parser.add_argument('--max-matches', type=int, metavar='N',
+                               help="stop reading a file after N matches")
+    search_parser.add_argument('-l', '--files-only', action='store_true',
+                               help="only list the files with matches, stopping at the first match in each")
+    search_parser.add_argument('--pdf-hits', action='store_true',
+                               help="find PDF matches with PyMuPDF's page search and report where they are on the page")
+    search_parser.set_defaults(function=search)
+
+    index_parser = commands.add_parser('index', parents=[common], help="build or refresh the full-text index of a folder")
+    index_parser.add_argument('path', help="folder to index, including its subfolders")
+    index_parser.set_defaults(function=index)
+
+    args = parser.parse_args(argv)
+    redirect_stdout()
+    try:
+        return args.function(args)
+    except KeyboardInterrupt:
+        return EXIT_INTERRUPTED
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""Compact store for the rows of the search results list.
+
+A search for a common term can match hundreds of thousands of files, and
+the details of the matches in every file add up to far more text than the
+list can show at once.  ResultStore keeps only the small parts of each row
+in memory: the file name (interned, since log names repeat from folder to
+folder), an index into a table of folders and the number of matches.  The
+details are compressed into a temporary file and read back when a row is
+drawn or opened, with the most recently used ones kept in memory.
+"""
+import array
+import collections
+import os
+import sys
+import tempfile
+import zlib
+
+# Number of rows whose details are kept in memory once read back.
+DETAILS_CACHE_SIZE = 256
+
+
+class ResultStore:
+    """Rows of (file, matches, details, path), with the details kept on disk."""
+    def __init__(self):
+        self.names = []  # File name of each row.
+        self.folders = []  # Each distinct folder (with its trailing separator), stored once.
+        self.folder_ids = {}
+        self.folder_index = array.array('I')  # Index into folders of each row.
+        self.matches = array.array('I')  # Number of matches in each row.
+        self.offsets = array.array('q')  # Where each row's details are in the spill file.
+        self.lengths = array.array('I')
+        self.spill = None  # Temporary file holding the compressed details.
+        self.spill_end = 0
+        self.cache = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.names)
+
+    def append(self, file, matches, details, path):
+        """Add a row; file is the name of the file at path, so it isn't stored twice."""
+        name = os.path.basename(path)
+        folder = path[:len(path) - len(name)]
+        folder_id = self.folder_ids.get(folder)
+        if folder_id is None:
+            folder_id = self.folder_ids[folder] = len(self.folders)
+            self.folders.append(folder)
+
+        data = zlib.compress(details.encode('utf-8', 'surrogatepass'), 1)
+        if self.spill is None:
+            self.spill = tempfile.TemporaryFile(prefix='PurrSearch-')
+        self.spill.seek(self.spill_end)
+        self.spill.write(data)
+
+        self.names.append(sys.intern(name))
+        self.folder_index.append(folder_id)
+        self.matches.append(matches)
+        self.offsets.append(self.spill_end)
+        self.lengths.append(len(data))
+        self.spill_end += len(data)
+
+    def extend(self, rows):
+        """Add (file, matches, details, path) rows, such as a batch of search results."""
+        for row in rows:
+            self.append(*row)
+
+    def path(self, row):
+        return self.folders[self.folder_index[row]] + self.names[row]
+
+    def details(self, row):
+        """Return the details of a row, reading them back from disk if needed."""
+        text = self.cache.get(row)
+        if text is not None:
+            self.cache.move_to_end(row)
+            return text
+        self.spill.seek(self.offsets[row])
+        text = zlib.decompress(self.spill.read(self.lengths[row])).decode('utf-8', 'surrogatepass')
+        self.cache[row] = text
+        if len(self.cache) > DETAILS_CACHE_SIZE:
+            self.cache.popitem(last=False)
+        return text
+
+    def __getitem__(self, row):
+        return (self.names[row], str(self.matches[row]), self.details(row), self.path(row))
+
+    def clear(self):
+        """Remove every row and delete the spill file."""
+        self.close()
+        self.__init__()
+
+    def close(self):
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
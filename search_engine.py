@@ -0,0 +1,661 @@
+"""Process-pool search engine, and the threads that run searches with it.
+
+The file parsers in search_functions (PyMuPDF, xlrd and the XML readers)
+hold the GIL for most of their work, so files are fanned out to a pool of
+worker processes rather than threads.
+"""
+import collections
+import concurrent.futures
+import functools
+import heapq
+import os
+import queue
+import threading
+import time
+
+from search_functions import (count_matches, extract_file, file_cost, file_type, merge_parts, search_file,
+                              search_parts, stream_file)
+from search_index import file_signature, SearchIndex
+
+# How many files to keep queued per worker so the pool never runs dry.
+FILES_PER_WORKER = 4
+# Seconds to wait on the pool before checking for a stop request again.
+POLL_INTERVAL = 0.1
+
+
+def default_workers():
+    """Return the default number of worker processes (one per CPU)."""
+    return os.cpu_count() or 1
+
+
+def walk_files(path, dir_mtimes=None):
+    """Yield an os.DirEntry for every file under path.
+
+    Each directory is listed exactly once with os.scandir, in the same
+    top-down order as os.walk.  Directories that can't be read are skipped,
+    and symbolic links to directories are not followed.  If dir_mtimes is
+    a dict, the st_mtime_ns of every directory listed is stored in it.
+    """
+    stack = [(path, None)]
+    while stack:
+        directory, dir_entry = stack.pop()
+        subdirs = []
+        try:
+            if dir_mtimes is not None:
+                stat = dir_entry.stat(follow_symlinks=False) if dir_entry else os.stat(directory)
+                dir_mtimes[directory] = stat.st_mtime_ns
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append((entry.path, entry))
+                        elif entry.is_file():
+                            yield entry
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+        stack.extend(reversed(subdirs))
+
+
+class FileWalker(threading.Thread):
+    """Walk a folder in the background, counting files by type as they are found.
+
+    Iterating over the walker yields the path of each file to search as soon
+    as it is found, so searching starts while the walk is still running.
+    total_files and the per-type counts keep growing until finished is set.
+    The modification time of every folder walked is kept in dir_mtimes.
+    """
+    def __init__(self, path, end_event):
+        super().__init__(daemon=True)
+        self.path = path
+        self.end_event = end_event
+        self.dir_mtimes = {}
+        self.total_files = 0
+        self.finished = False
+        self._file_types = collections.Counter()
+        self._lock = threading.Lock()
+        self._queue = queue.SimpleQueue()
+
+    def run(self):
+        try:
+            for entry in walk_files(self.path, self.dir_mtimes):
+                if self.end_event.is_set():
+                    break
+                if entry.name.startswith('~$'):  # Skip temporary files
+                    continue
+                kind = file_type(entry.path)
+                if kind is None:
+                    continue
+                with self._lock:
+                    self._file_types[kind] += 1
+                    self.total_files += 1
+                self._queue.put(entry.path)
+        finally:
+            self.finished = True
+            self._queue.put(None)
+
+    def __iter__(self):
+        while True:
+            file_path = self._queue.get()
+            if file_path is None:
+                return
+            yield file_path
+
+    def file_types(self):
+        """Return a snapshot of the number of files found for each type."""
+        with self._lock:
+            return dict(self._file_types)
+
+
+def cheapest_first(items, cost, window):
+    """Yield items reordered so the cheaper ones go first, looking ahead window items.
+
+    cost(item) is the item's cost class (see file_cost()).  An item is held
+    back at most window places for each class it costs above the cheapest,
+    so a run of cheap files can't hold an expensive one back for ever.
+    """
+    heap = []
+    for position, item in enumerate(items):
+        heapq.heappush(heap, (position + (cost(item) - 1) * window, position, item))
+        if len(heap) >= window:
+            yield heapq.heappop(heap)[2]
+    while heap:
+        yield heapq.heappop(heap)[2]
+
+
+def map_files(function, file_paths, end_event, workers=None, cost=None):
+    """Call function(file_path) for each file on a pool of worker processes.
+
+    file_paths may be any iterable (including a FileWalker that is still
+    walking the directory tree); it is consumed lazily so that only a few
+    files per worker are queued at a time.  Yields (file_path, result, error)
+    tuples in completion order, where error is None or the exception raised
+    for that file.  Stops as soon as end_event is set; files that have not
+    been started yet are cancelled.  The items may also be any other
+    picklable task for function, such as the (file_path, part) tasks of
+    search_files().  If cost is given, the files queued next are taken
+    cheapest first by cost(file_path) (see cheapest_first()), so the quick
+    results aren't held up behind large PDFs.
+    """
+    workers = max(1, workers or default_workers())
+    if cost is not None:
+        file_paths = cheapest_first(file_paths, cost, workers * FILES_PER_WORKER)
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    pending = {}
+
+    def collect(wait_for_all):
+        """Wait for running files and yield the finished ones."""
+        nonlocal pending
+        while pending and not end_event.is_set():
+            done, _ = concurrent.futures.wait(
+                pending, timeout=POLL_INTERVAL,
+                return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                file_path = pending.pop(future)
+                try:
+                    yield file_path, future.result(), None
+                except Exception as err:
+                    yield file_path, None, err
+            if done and not wait_for_all:
+                return
+
+    try:
+        for file_path in file_paths:
+            if end_event.is_set():
+                return
+            pending[executor.submit(function, file_path)] = file_path
+            if len(pending) >= workers * FILES_PER_WORKER:
+                yield from collect(wait_for_all=False)
+        yield from collect(wait_for_all=True)
+    finally:
+        # Don't block a stop request on files that are already being parsed.
+        executor.shutdown(wait=not end_event.is_set(), cancel_futures=True)
+
+
+def search_task(task, text):
+    """Search a file, or one part of it, given as (file_path, part); see search_file()."""
+    file_path, part = task
+    return search_file(file_path, text, part)
+
+
+def search_files(file_paths, text, end_event, workers=None):
+    """Search files for text on a pool of worker processes.
+
+    Yields (file_path, matches, error) tuples as each file finishes; see
+    map_files().  Large PDFs are split into parts (see search_parts()) that
+    are searched on different workers and joined again in page order.
+    """
+    workers = max(1, workers or default_workers())
+    parts = {}  # Results of each part of the split files, None until it finishes.
+
+    def tasks():
+        for file_path in file_paths:
+            count = search_parts(file_path, workers)
+            if count == 1:
+                yield file_path, None
+                continue
+            parts[file_path] = [None] * count
+            for index in range(count):
+                yield file_path, (index, count)
+
+    for (file_path, part), matches, error in map_files(functools.partial(search_task, text=text), tasks(),
+                                                       end_event, workers, cost=lambda task: file_cost(task[0])):
+        if part is None:
+            yield file_path, matches or [], error
+            continue
+        results = parts[file_path]
+        results[part[0]] = (matches or [], error)
+        if any(result is None for result in results):
+            continue
+        del parts[file_path]
+        error = next((error for _, error in results if error is not None), None)
+        yield file_path, merge_parts((matches for matches, _ in results), text), error
+
+
+def read_until(chunks, end_event):
+    """Yield the chunks of a streamed file, raising InterruptedError once end_event is set."""
+    for chunk in chunks:
+        if end_event.is_set():
+            raise InterruptedError("Stopped before the whole file was read")
+        yield chunk
+
+
+def extract_files(file_paths, end_event, workers=None):
+    """Extract the text of files on a pool of worker processes.
+
+    Yields (file_path, format_name, chunks, error) tuples as each file
+    finishes, where format_name and the list of (location, text) chunks are
+    from extract_file().  Large text files, logs and archives aren't sent
+    to the workers: their chunks are an iterator that reads the file as it
+    is consumed (see stream_file()), so reading them may raise as well.
+    """
+    streamed = collections.deque()  # Streamed files not handed out yet.
+
+    def tasks():
+        for file_path in file_paths:
+            try:
+                stream = stream_file(file_path)
+            except OSError:
+                stream = None  # Let the worker report it.
+            if stream is None:
+                yield file_path
+            else:
+                streamed.append((file_path, stream))
+
+    def take_streamed():
+        while streamed:
+            file_path, (format_name, chunks) = streamed.popleft()
+            yield file_path, format_name, read_until(chunks, end_event), None
+
+    for file_path, extracted, error in map_files(extract_file, tasks(), end_event, workers, cost=file_cost):
+        yield from take_streamed()
+        format_name, chunks = extracted or (None, [])
+        yield file_path, format_name, chunks, error
+    if not end_event.is_set():
+        yield from take_streamed()
+
+
+class CancelToken(threading.Event):
+    """Flag that stops a search, shared by the search and whoever started it.
+
+    It is a threading.Event, so it can be passed anywhere an end_event is
+    expected.
+    """
+    def cancel(self):
+        """Ask the search to stop as soon as it can."""
+        self.set()
+
+    @property
+    def cancelled(self):
+        return self.is_set()
+
+
+class Search:
+    """Search the files in a folder, or the folder's index, for text.
+
+    Iterating over a Search runs it, yielding (file_path, matches) for each
+    file with matches in the order the files finish.  Nothing here needs a
+    GUI; progress is reported through optional callbacks, which are called
+    from the thread doing the iterating:
+
+        on_progress(search)  after a file is found, started or finished; read
+                             processed_files, total_files, finished,
+                             current_file and file_types() from the search
+        on_status(text)      with a line of text about the search
+        on_error(file_path, error)  when a file couldn't be searched
+
+    total_files keeps growing until finished is set, as for a FileWalker.
+    Cancelling the token stops the search at the next file.
+    """
+    def __init__(self, path, text, token=None, workers=None, use_index=False,
+                 on_progress=None, on_status=None, on_error=None):
+        self.path = path
+        self.text = text
+        self.token = token if token is not None else CancelToken()
+        self.workers = workers or default_workers()
+        self.use_index = use_index  # Query the folder's index instead of its files.
+        self.on_progress = on_progress
+        self.on_status = on_status
+        self.on_error = on_error
+
+        self.walker = None
+        self.indexed_files = 0
+        self.current_file = None
+        self.processed_files = 0
+        self.files_with_matches = 0
+        self.elapsed = 0.0
+
+    @property
+    def total_files(self):
+        return self.walker.total_files if self.walker else self.indexed_files
+
+    @property
+    def finished(self):
+        """True once total_files is final."""
+        return self.walker.finished if self.walker else self.use_index
+
+    @property
+    def cancelled(self):
+        return self.token.is_set()
+
+    def file_types(self):
+        """Return a snapshot of the number of files found for each type."""
+        return self.walker.file_types() if self.walker else {}
+
+    def __iter__(self):
+        start_time = time.time()
+        try:
+            if self.use_index:
+                yield from self.search_index()
+            else:
+                yield from self.search_files()
+        finally:
+            self.elapsed = time.time() - start_time
+
+    def progress(self):
+        if self.on_progress is not None:
+            self.on_progress(self)
+
+    def status(self, text):
+        if self.on_status is not None:
+            self.on_status(text)
+
+    def iter_files(self):
+        """Yield the paths found by the walker, reporting each one."""
+        for file_path in self.walker:
+            self.current_file = file_path
+            self.progress()
+            yield file_path
+
+    def search_files(self):
+        # Walk the folder once in the background; files are searched as soon
+        # as they are found and the total keeps growing until the walk ends.
+        self.walker = FileWalker(self.path, self.token)
+        self.walker.start()
+        self.progress()
+
+        # Fan the files out to the worker processes and collect the results
+        # in the order they finish.
+        for file_path, matches, error in search_files(self.iter_files(), self.text, self.token, self.workers):
+            self.processed_files += 1
+            if error is not None:
+                if self.on_error is not None:
+                    self.on_error(file_path, error)
+            elif matches:
+                self.files_with_matches += 1
+                yield file_path, matches
+            self.progress()
+        self.progress()
+
+    def search_index(self):
+        """Search the full-text index of the folder instead of its files."""
+        index = SearchIndex(self.path)
+        try:
+            self.indexed_files = index.file_count()
+            self.status(f"Searching the index of {self.indexed_files} files in {self.path}.\n")
+            self.progress()
+            for file_path, matches in index.search(self.text, self.token):
+                self.processed_files += 1
+                self.files_with_matches += 1
+                yield file_path, matches
+        finally:
+            index.close()
+
+
+class SearchThread(threading.Thread):
+    """Thread to run a Search, posting what it finds to a queue.
+
+    text is the string or SearchTerms to search for.  Progress, results and
+    errors are posted to result_queue as tuples whose first item is the
+    message type ('status', 'summary', 'status_bar', 'progress', 'results',
+    'error' or 'complete').  Results are posted in batches, as a list of
+    (file, matches, details, path) tuples, and are coalesced with the
+    progress into one update every UPDATE_INTERVAL seconds, so the number of
+    messages grows with the time taken rather than the number of files.
+    If result_queue has a maxsize, the search waits while it is full, which
+    in turn stops new files being handed to the worker processes.  Setting
+    end_event stops the search.
+    """
+    SUMMARY_INTERVAL = 0.5  # Seconds between updates of the file count summary.
+    UPDATE_INTERVAL = 0.1  # Seconds between batches of results and progress.
+
+    def __init__(self, end_event, path, text, result_queue, workers=None, use_index=False):
+        super().__init__()
+        self.end_event = end_event
+        self.path = path
+        self.text = text
+        self.result_queue = result_queue
+        self.workers = workers or default_workers()
+        self.use_index = use_index  # Query the folder's index instead of its files.
+
+        self.initial_message = None
+        self.summary_time = 0
+        self.progress = 0
+        self.update_time = 0
+        self.results = []  # Results not posted yet.
+        self.current_file = None
+        self.posted_file = None  # The file last shown in the status bar.
+        self.statusText = "Status: Not Running"
+        self.error = None
+
+    def run(self):
+        if self.end_event.is_set(): # means the search is set to stop
+            return
+        try:
+            self.performSearch(self.path, self.text)
+        except Exception as err:
+            self.error = f"Search failed with error: {err}"
+            self.post(('error', self.error))
+
+    def post(self, message):
+        """Put a message on result_queue, waiting while the queue is full.
+
+        Once the search has been stopped the message is dropped instead, so
+        whoever stopped it can join the thread without draining the queue.
+        """
+        while True:
+            try:
+                self.result_queue.put(message, timeout=POLL_INTERVAL)
+                return
+            except queue.Full:
+                if self.end_event.is_set():
+                    return
+
+    def postSummary(self, walker, force=False):
+        """Post the running file count, at most every SUMMARY_INTERVAL seconds.
+
+        walker is a FileWalker or a Search.
+        """
+        now = time.time()
+        if not force and now - self.summary_time < self.SUMMARY_INTERVAL:
+            return
+        self.summary_time = now
+        file_types = walker.file_types()
+
+        self.initial_message = f"Searching in {walker.total_files} files"
+        self.initial_message += ".\n" if walker.finished else " (still counting...).\n"
+        self.initial_message += "This may take a while depending on the number of files.\n\n"
+        self.initial_message += "FILES COUNT BY TYPE:"
+
+        for ext, count in file_types.items():
+            self.initial_message += f"\n{ext if ext else 'No extension'}: {count}"
+
+        # Add log file count information
+        log_count = file_types.get('log', 0)
+        if log_count > 0:
+            self.initial_message += f"\n\nTotal log files (including compressed): {log_count}"
+
+        self.post(('summary', self.initial_message))
+
+    def postProgress(self, processed_files, walker):
+        """Update the progress bar and percentage against the files found so far."""
+        if walker.total_files:
+            self.progress = int((processed_files / walker.total_files) * 100)
+        if not walker.finished:
+            self.progress = min(self.progress, 99)
+        self.post(('progress', self.progress, f"{self.progress}%"))
+        self.postSummary(walker)
+
+    def postUpdate(self, processed_files, walker=None, total_files=0, force=False):
+        """Post the results, current file and progress, at most every UPDATE_INTERVAL seconds.
+
+        Progress is measured against the walker (a FileWalker or a Search)
+        while it is still finding files, or against a known total_files.
+        """
+        now = time.time()
+        if not force and now - self.update_time < self.UPDATE_INTERVAL:
+            return
+        self.update_time = now
+        if self.results:
+            self.post(('results', self.results))
+            self.results = []
+        if self.current_file != self.posted_file:
+            self.posted_file = self.current_file
+            self.post(('status_bar', f"Searching in file: {os.path.basename(self.current_file)}"))
+        if walker is not None:
+            self.postProgress(processed_files, walker)
+        elif total_files:
+            self.progress = int((processed_files / total_files) * 100)
+            self.post(('progress', self.progress, f"{self.progress}%"))
+
+    def postError(self, file_path, error):
+        self.error = f"\n\nError processing {file_path}: {error}\n\n"
+        self.post(('error', self.error))
+
+    def onProgress(self, search):
+        """Search callback, post the file being searched and the progress."""
+        self.current_file = search.current_file
+        self.postUpdate(search.processed_files, search)
+
+    def performSearch(self, path, text):
+        end_event = self.end_event
+        search = Search(path, text, end_event, self.workers, self.use_index,
+                        on_progress=None if self.use_index else self.onProgress,
+                        on_status=lambda status: self.post(('status', status)),
+                        on_error=self.postError)
+
+        self.summary_time = 0
+        self.post(('progress', self.progress, "0%"))
+        for file_path, matches in search:
+            result_text = "\n".join(matches)
+            self.results.append((os.path.basename(file_path), count_matches(matches), result_text, file_path))
+            if self.use_index:
+                self.postUpdate(search.processed_files)
+
+        if self.use_index:
+            self.postUpdate(search.processed_files, force=True)
+        else:
+            self.postUpdate(search.processed_files, search, force=True)
+            self.postSummary(search, force=True)
+        if end_event.is_set():
+            self.post(('status', "\n\n\u1360 Search stopped by user.\u1360\n"))
+            self.post(('progress', 100, "Stopped"))
+            return
+
+        # Report the total search time, reset the search button
+        kind = "Index search" if self.use_index else "Search"
+        self.initial_message = f"\n\n{kind} finished in {search.elapsed:.3f} seconds. {search.files_with_matches} files found with matches."
+        self.post(('status', self.initial_message))
+        if self.use_index:
+            self.post(('progress', 100, "100%"))
+        self.post(('complete',))
+        end_event.set()
+
+    def stop(self, block=True):
+        """Signal the thread to end."""
+        self.end_event.set()
+# end class SearchThread(threading.Thread)
+
+
+class IndexThread(SearchThread):
+    """Thread to build or refresh the full-text index of a particular folder."""
+    def __init__(self, end_event, path, result_queue, workers=None):
+        super().__init__(end_event, path, None, result_queue, workers)
+        self.processed_files = 0
+        self.signatures = {}  # (size, mtime, inode) of each file, taken before it is read.
+
+    def run(self):
+        if self.end_event.is_set(): # means indexing is set to stop
+            return
+        try:
+            self.performIndex(self.path)
+        except Exception as err:
+            self.error = f"Indexing failed with error: {err}"
+            self.post(('error', self.error))
+
+    def iterFiles(self, walker):
+        """Yield the paths found by the walker, remembering their signatures."""
+        for file_path in walker:
+            self.current_file = file_path
+            self.postUpdate(self.processed_files, walker)
+            try:
+                self.signatures[file_path] = file_signature(file_path)
+            except OSError:
+                continue
+            yield file_path
+
+    def performIndex(self, path):
+        start_time = time.time()  # Start timing the indexing
+        end_event = self.end_event
+        self.post(('progress', self.progress, "0%"))
+
+        index = SearchIndex(path)
+        try:
+            if index.file_count():
+                processed_files = self.refreshIndex(index)
+            else:
+                processed_files = self.buildIndex(index)
+            index.commit()
+        finally:
+            index.close()
+
+        if end_event.is_set():
+            self.post(('status', "\n\n\u1360 Indexing stopped by user, the index is incomplete.\u1360\n"))
+            self.post(('progress', 100, "Stopped"))
+            return
+
+        elapsed_time = time.time() - start_time
+        self.initial_message = f"\n\nIndexed {processed_files} files in {elapsed_time:.3f} seconds."
+        self.post(('status', self.initial_message))
+        self.post(('progress', 100, "100%"))
+        self.post(('complete',))
+        end_event.set()
+
+    def addFiles(self, index, extracted, walker=None, total_files=0):
+        """Add the files from extract_files() to the index, returning how many were read.
+
+        Progress is measured against the walker while it is still finding
+        files, or against a known total_files.
+        """
+        for file_path, format_name, chunks, error in extracted:
+            signature = self.signatures.pop(file_path)
+            if error is None:
+                try:
+                    index.add_file(file_path, signature, chunks, format_name)
+                except Exception as err:  # A streamed file that failed part way through.
+                    error = err
+            if error is not None:
+                index.add_unread(file_path)
+                if not self.end_event.is_set():
+                    self.postError(file_path, error)
+
+            self.processed_files += 1
+            self.postUpdate(self.processed_files, walker, total_files)
+        self.postUpdate(self.processed_files, walker, total_files, force=True)
+        return self.processed_files
+
+    def buildIndex(self, index):
+        """Index every file in the folder, reading files as they are found."""
+        end_event = self.end_event
+        walker = FileWalker(index.folder, end_event)
+        walker.start()
+        self.summary_time = 0
+
+        index.clear()
+        extracted = extract_files(self.iterFiles(walker), end_event, self.workers)
+        processed_files = self.addFiles(index, extracted, walker)
+        self.postSummary(walker, force=True)
+        if walker.finished and not end_event.is_set():
+            index.save_dirs(walker.dir_mtimes)
+        return processed_files
+
+    def refreshIndex(self, index):
+        """Only read the files that were added or changed since the last index."""
+        end_event = self.end_event
+        self.post(('status', f"Checking {index.file_count()} indexed files for changes...\n"))
+        self.post(('status_bar', f"Checking for changes in: {index.folder}"))
+        changes = index.scan_changes(end_event)
+        if changes is None:
+            return 0
+        self.signatures, deleted, dir_mtimes = changes
+        self.post(('status', f"{len(self.signatures)} files added or changed, {len(deleted)} files deleted.\n"))
+
+        for file_path in deleted:
+            index.remove_file(file_path)
+        extracted = extract_files(list(self.signatures), end_event, self.workers)
+        processed_files = self.addFiles(index, extracted, total_files=len(self.signatures))
+        if not end_event.is_set():
+            index.save_dirs(dir_mtimes)
+        return processed_files
+# end class IndexThread(SearchThread)
@@ -1,36 +1,422 @@
-from docx2python import docx2python  # pip install docx2python python-docx
-import openpyxl  # pip install openpyxl
 import fitz  # pip install PyMuPDF
-from vsdx import VisioFile # pip install vsdx
-from docx import Document
+import olefile  # pip install olefile
 import xlrd
-
+try:
+    import zstandard  # pip install zstandard (only needed for .zst files)
+except ImportError:
+    zstandard = None
+
+import bisect
+import bz2
+import functools
 import gzip
+import io
+import itertools
+import lzma
+import mmap
 import os
 import re
-
-import sys
-print(sys.version)
+import tarfile
+import zipfile
+import zlib
+
+import msdoc
+import ooxml
+from text_cache import get_cache
+
+# File formats that are never searched (images, shortcuts, temporary files).
+SKIPPED_FORMATS = ['.jpg', '.db', '.png', '.wbk', '.jpeg', '.pptx', '.shs', '.lnk', '.tmp', '.bmp', '.msg', '.vsd']
+# Number of characters binary_search() reads at a time.
+BINARY_CHUNK_SIZE = 1024 * 1024
+# Number of bytes log_search() reads (and decompresses) at a time.
+LOG_BLOCK_SIZE = 1024 * 1024
+# PDFs are searched in parts of at least this many pages on separate workers.
+PDF_PART_PAGES = 50
+# PDFs smaller than this aren't opened to count their pages for splitting.
+PDF_SPLIT_SIZE = 1024 * 1024
+# Text files, logs and archives of this many bytes or more are indexed as a
+# stream of chunks rather than one list from a worker; see stream_file().
+STREAM_SIZE = 16 * 1024 * 1024
+# Plain-text formats searched with mmap_search().
+TEXT_FORMATS = ['.txt', '.rtf', '.csv', '.mib', '.bat', '.sh', '.c', '.cpp', '.h', '.cs', 'html', '.htm', '.css', '.php', '.js', '.xml', '.ini', '.cfg', '.json', '.java', '.tex', '.rst', '.md', '.ps', '.nfo', '.info', '.py', '.yaml', '.toml']
+
+# Compressed files (detected by their magic bytes, not only these names).
+COMPRESSED_FORMATS = ('.gz', '.bz2', '.xz', '.zst')
+# Archives whose members are searched in place.
+ARCHIVE_FORMATS = ('.zip', '.tar', '.tgz', '.tbz', '.tbz2', '.txz', '.tzst',
+                   '.tar.gz', '.tar.bz2', '.tar.xz', '.tar.zst')
+
+# Separates several terms typed into a single search.
+TERM_SEPARATOR = ';'
+# Longest match assumed for a regular expression when a file is read in chunks.
+REGEX_MAX_MATCH = 1024
+# Added after the last match kept when a file has more than max_matches.
+MORE_MATCHES = "[... more matches in this file]"
+# The characters and words of the text of number, date, time and boolean
+# cells, such as "-1.5e-05", "2024-01-31 12:00:00", "1 day, 6:00:00",
+# "True" and "#VALUE!" (a date out of range).
+NUMBER_CHARACTERS = frozenset("0123456789.-+:, #!")
+NUMBER_WORDS = ('days', 'true', 'false', 'value')
+# The start of a run of rich text in a workbook string (<r>, or <x:r> with
+# a prefix), which a term could straddle.
+RICH_TEXT_RUNS = (b'<r>', b'<r ', b':r>', b':r ')
+# Number of spreadsheet cells matched together in one scan; see matching_strings().
+CELL_BATCH_SIZE = 65536
+# Bytes read from the start of a file to tell what it holds; see sniff().
+SNIFF_SIZE = 4096
+# The first bytes of an OLE compound file.
+OLE_SIGNATURE = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+# Text that starts with a byte order mark may have NUL bytes (UTF-16).
+TEXT_BOMS = (b'\xef\xbb\xbf', b'\xff\xfe', b'\xfe\xff')
+
+
+class SearchTerms:
+    """The terms to search for, all matched in a single pass over each file.
+
+    Either a list of literal terms, each matched as a substring ignoring
+    case, or a single regular expression.  Every search function that takes
+    a text argument also accepts a SearchTerms; see as_terms().
+
+    The search functions stop reading a file once they have max_matches
+    matches (None for no limit), or at its first match with files_only;
+    see add().  With pdf_hits, PDFs are searched with pdf_hit_search().
+    """
+    def __init__(self, terms, regex=False, case_sensitive=False, max_matches=None, files_only=False,
+                 pdf_hits=False):
+        self.terms = [terms] if isinstance(terms, str) else list(terms)
+        self.regex = regex
+        self.case_sensitive = case_sensitive
+        self.max_matches = max_matches or None
+        self.files_only = files_only
+        self.pdf_hits = pdf_hits
+        flags = 0 if case_sensitive else re.IGNORECASE
+        if regex:
+            self.pattern = re.compile(self.terms[0], flags)
+            self.max_length = REGEX_MAX_MATCH
+        else:
+            # Longest terms first, so a term that contains another one wins.
+            ordered = sorted(self.terms, key=len, reverse=True)
+            self.pattern = re.compile('|'.join(re.escape(term) for term in ordered), flags)
+            self.max_length = max(len(term) for term in self.terms)
+        self.by_text = {(term if case_sensitive else term.lower()): term for term in self.terms}
+        self._byte_pattern = None
+        self._folded_byte_patterns = None
+
+    @classmethod
+    def parse(cls, text, regex=False, **options):
+        """Return the SearchTerms for text typed by the user.
+
+        Several literal terms are separated by TERM_SEPARATOR; with regex,
+        the whole text is one regular expression (re.error if it's invalid).
+        The other options are passed on to SearchTerms().
+        """
+        if regex:
+            return cls(text, regex=True, **options)
+        terms = [term.strip() for term in text.split(TERM_SEPARATOR) if term.strip()]
+        return cls(terms or [text], **options)
+
+    def __str__(self):
+        return self.terms[0] if self.regex else f"{TERM_SEPARATOR} ".join(self.terms)
+
+    @property
+    def empty(self):
+        """True if there is nothing to search for."""
+        return not any(self.terms)
+
+    @property
+    def multiple(self):
+        """True if matches need to say which term they are for."""
+        return self.regex or len(self.terms) > 1
+
+    def add(self, matches, match):
+        """Add a match to the list of matches in a file.
+
+        Returns False once no more matches are wanted from the file: after
+        the first one with files_only, or when a match beyond max_matches
+        comes along, in which case MORE_MATCHES is added instead of it.
+        """
+        if self.max_matches is not None and len(matches) >= self.max_matches:
+            matches.append(MORE_MATCHES)
+            return False
+        matches.append(match)
+        return not self.files_only
+
+    def search(self, text, pos=0):
+        """Return the first match in text, or None."""
+        return self.pattern.search(text, pos)
+
+    def finditer(self, text, pos=0):
+        """Return an iterator over all the (non-overlapping) matches in text."""
+        return self.pattern.finditer(text, pos)
+
+    def term(self, match):
+        """Return the term that a match is for (the matched text, for a regex)."""
+        text = match.group()
+        if self.regex:
+            return text
+        return self.by_text.get(text if self.case_sensitive else text.lower(), text)
+
+    def found(self, text):
+        """Return the distinct terms found in text, in the order they appear."""
+        return list(dict.fromkeys(self.term(match) for match in self.finditer(text)))
+
+    def label(self, text):
+        """Return ' | Term: ...' naming the terms found in text, when there are several."""
+        if not self.multiple:
+            return ""
+        return " | Term: " + ", ".join(self.found(text))
+
+    def highlight(self, text):
+        """Mark every match in text as [MATCH: term]."""
+        return self.pattern.sub(lambda match: f"[MATCH: {self.term(match)}]", text)
+
+    def byte_pattern(self):
+        """Return a bytes pattern that finds the terms in UTF-8, or None for a regex."""
+        if self.regex:
+            return None
+        if self._byte_pattern is None:
+            ordered = sorted(self.terms, key=len, reverse=True)
+            if self.case_sensitive:
+                self._byte_pattern = re.compile(b'|'.join(re.escape(term.encode('utf-8')) for term in ordered))
+            else:
+                self._byte_pattern = re.compile(
+                    b'|'.join(byte_pattern(term).pattern for term in ordered), re.IGNORECASE)
+        return self._byte_pattern
+
+    def folded_byte_patterns(self):
+        """Return a bytes pattern for each term, to match in bytes lowercased with bytes.lower().
+
+        re.IGNORECASE makes a bytes pattern several times slower, and it
+        only folds ASCII letters, as bytes.lower() does; so for a large
+        block it's quicker to lowercase the block and match it with case
+        sensitive patterns.  A pattern per term stays a plain literal that
+        re can find quickly, unlike an alternation of them.  When the terms
+        are case sensitive the patterns are for the bytes as they are.
+        """
+        if self.regex:
+            return None
+        if self._folded_byte_patterns is None:
+            if self.case_sensitive:
+                self._folded_byte_patterns = [re.compile(re.escape(term.encode('utf-8'))) for term in self.terms]
+            else:
+                # Non-ASCII characters are matched as alternatives of each
+                # case, which lower() leaves alone.
+                self._folded_byte_patterns = [re.compile(byte_pattern(term).pattern.lower()) for term in self.terms]
+        return self._folded_byte_patterns
+
+
+def as_terms(text, case_sensitive=False):
+    """Return text as a SearchTerms, if it's a plain string."""
+    if isinstance(text, SearchTerms):
+        return text
+    return SearchTerms(text, case_sensitive=case_sensitive)
+
+
+def count_matches(matches):
+    """Return the number of matches in a list from a search function."""
+    return len(matches) - 1 if matches and matches[-1] == MORE_MATCHES else len(matches)
+
+
+def cached_text(file_path, kind, extract):
+    """Return the (location, text) chunks of a document.
+
+    The chunks come from the on-disk text cache when the file's size and
+    modification time haven't changed since it was last extracted, otherwise
+    extract(file_path) is called and its result is cached.
+    """
+    cache = get_cache()
+    if cache is None:
+        return extract(file_path)
+    stat = os.stat(file_path)
+    chunks = cache.get(file_path, kind, stat.st_size, stat.st_mtime_ns)
+    if chunks is None:
+        chunks = extract(file_path)
+        cache.put(file_path, kind, stat.st_size, stat.st_mtime_ns, chunks)
+    return chunks
+
+
+def cached_chunks(file_path, kind):
+    """Return the (location, text) chunks of a document if they're in the text cache, or None."""
+    cache = get_cache()
+    if cache is None:
+        return None
+    stat = os.stat(file_path)
+    return cache.get(file_path, kind, stat.st_size, stat.st_mtime_ns)
+
+
+def caching_chunks(file_path, kind, chunks):
+    """Yield the (location, text) chunks from an extractor, putting them in the text cache once all are read.
+
+    A search that stops early leaves the cache as it was, so the rest of
+    the file is never read just to be cached.
+    """
+    cache = get_cache()
+    if cache is None:
+        yield from chunks
+        return
+    stat = os.stat(file_path)
+    read = []
+    for chunk in chunks:
+        read.append(chunk)
+        yield chunk
+    cache.put(file_path, kind, stat.st_size, stat.st_mtime_ns, read)
+
+
+def find_chunks(chunks, text):
+    """Yield the (location, text) chunks that contain any of the terms, ignoring case."""
+    terms = as_terms(text)
+    if terms.empty:
+        return
+    for location, chunk in chunks:
+        if terms.search(chunk):
+            yield location, chunk
+
+
+# How each format describes the matches in a chunk of its text: each of
+# these yields the details of a matching (location, text) chunk, the same for
+# a search of the file and a search of its index.
+def line_details(location, line, terms):
+    """Describe a line with a match as log_search() and archive_search() do."""
+    yield f"{location}: {terms.highlight(line).strip()}"
+
+def context_details(location, text, terms, context_chars=32):
+    """Describe each match in text by the text around it, as mmap_search() does."""
+    for match in terms.finditer(text):
+        start = max(match.start() - context_chars, 0)
+        yield f"CONTEXT: '{terms.highlight(text[start:match.end() + context_chars].lower())}'"
+
+def paragraph_details(location, paragraph, terms):
+    """Describe a paragraph of a Word document with a match."""
+    yield f"{location} | Text: {paragraph}{terms.label(paragraph)}"
+
+def shape_details(location, shape_text, terms):
+    """Describe a shape of a Visio drawing with a match."""
+    yield f"{location} | Text: {shape_text.strip()}{terms.label(shape_text)}"
+
+def value_details(location, value, terms):
+    """Describe an .xls cell with a match."""
+    yield f"{location} | Value: {value.lower()}{terms.label(value)}"
+
+def content_details(location, value, terms):
+    """Describe an .xlsx cell with a match."""
+    yield f"{location} | Content: {value}{terms.label(value)}"
+
+def page_details(location, page_text, terms, context_chars=32):
+    """Describe each match on a PDF page by the text around it."""
+    for match in terms.finditer(page_text):
+        start = max(0, match.start() - context_chars)
+        end = min(len(page_text), match.end() + context_chars)
+        context = page_text[start:end].lower()
+        if terms.multiple:
+            context = terms.highlight(context)
+        yield f"{location}:\n{context.strip()}\n"
+
+
+def matching_strings(strings, terms):
+    """Return the indexes of the non-empty strings in a list that have a match, in order.
+
+    Literal terms are looked for in all the strings joined into one, which
+    is much quicker than a search per string for the many short strings of
+    a spreadsheet: a match is mapped back to its string by where the
+    strings start (not by counting separators, which a cell may hold too),
+    and the search goes on from the next string.
+    """
+    if terms.empty:
+        return []
+    if terms.regex:
+        # A regular expression could match across the joins.
+        return [index for index, string in enumerate(strings) if string and terms.search(string)]
+    joined = '\0'.join(strings)
+    starts = list(itertools.accumulate((len(string) + 1 for string in strings[:-1]), initial=0))
+    wanted = []
+    match = terms.search(joined)
+    while match is not None:
+        index = bisect.bisect_right(starts, match.start()) - 1
+        if strings[index]:
+            wanted.append(index)
+        index += 1
+        if len(wanted) >= 100 and len(wanted) * 5 > index:
+            # So many strings match that a search per string is quicker.
+            wanted.extend(index for index in range(index, len(strings))
+                          if strings[index] and terms.search(strings[index]))
+            break
+        if index >= len(strings):
+            break
+        match = terms.search(joined, starts[index])  # On to the next string.
+    return wanted
+
+def find_cells(chunks, terms):
+    """Yield the (location, text) chunks of a spreadsheet that have a match, like find_chunks().
+
+    The cells are matched CELL_BATCH_SIZE at a time with matching_strings().
+    """
+    chunks = iter(chunks)
+    while batch := list(itertools.islice(chunks, CELL_BATCH_SIZE)):
+        for index in matching_strings([text for location, text in batch], terms):
+            yield batch[index]
+
+
+# .xls
+def xls_sheets(file_path, numbers=True):
+    """Yield (sheet name, number of columns, cell text) for each sheet of an .xls file.
+
+    The workbook is opened on demand, so only one sheet is loaded at a
+    time, and a search that stops early never loads the rest.  The cell
+    text is a list of every cell's str() value, a row after another, taken
+    from the sheet a row at a time; cell i is in row i // ncols, column
+    i % ncols.  With numbers=False the number, date, boolean and error cells
+    are left empty, which saves turning them into text when no term could
+    match them.
+    """
+    workbook = xlrd.open_workbook(file_path, on_demand=True)
+    try:
+        for index in range(workbook.nsheets):
+            sheet = workbook.sheet_by_index(index)
+            values = itertools.chain.from_iterable(sheet.row_values(row) for row in range(sheet.nrows))
+            if numbers:
+                cells = list(map(str, values))
+            else:
+                cells = [value if value.__class__ is str else '' for value in values]
+            yield sheet.name, sheet.ncols, cells
+            workbook.unload_sheet(index)
+    finally:
+        workbook.release_resources()
+
+def xls_location(sheet_name, ncols, index):
+    """Return the location of the index-th cell of a sheet from xls_sheets()."""
+    return f"Sheet: '{sheet_name}' | Row: {index // ncols + 1} | Cell: {index % ncols + 1}"
+
+def extract_xls_text(file_path):
+    """Return the non-empty cells of an .xls file as (location, value) chunks."""
+    return [(xls_location(sheet_name, ncols, index), cell_value)
+            for sheet_name, ncols, cells in xls_sheets(file_path)
+            for index, cell_value in enumerate(cells) if cell_value]
+
+def xls_matching_cells(file_path, terms):
+    """Yield the (location, value) of the cells of an .xls file with a match, a sheet at a time.
+
+    Each sheet's cells are searched together with matching_strings()
+    rather than one search per cell.
+    """
+    numbers = terms.regex or any(may_be_number_text(term) for term in terms.terms)
+    for sheet_name, ncols, cells in xls_sheets(file_path, numbers):
+        for index in matching_strings(cells, terms):
+            yield xls_location(sheet_name, ncols, index), cells[index]
 
 def xls_search(file_path, text):
     """Search inside .xls files and return matches with context."""
     matches = []
+    terms = as_terms(text)
     try:
-        # Open the .xls file
-        workbook = xlrd.open_workbook(file_path)
-        text_lower = text.lower()
-
-        # Iterate through all sheets
-        for sheet in workbook.sheets():
-            for row_num in range(sheet.nrows):
-                for col_num in range(sheet.ncols):
-                    cell_value = str(sheet.cell_value(row_num, col_num)).lower()
-                    if text_lower in cell_value:
-                        # Capture some context (surrounding rows)
-                        matches.append(f"Sheet: '{sheet.name}' | Row: {row_num + 1} | Cell: {col_num + 1} | Value: {cell_value}")
-                        if len(matches) >= 10:
-                            matches.append(f"[... more results in this sheet]")
-                            return matches
+        chunks = cached_chunks(file_path, 'xls')
+        if chunks is not None:
+            cells = find_cells(chunks, terms)
+        else:
+            cells = xls_matching_cells(file_path, terms)
+        for location, cell_value in cells:
+            for detail in value_details(location, cell_value, terms):
+                if not terms.add(matches, detail):
+                    return matches
 
     except Exception as e:
         print(f"Error processing {file_path}: {e}")
@@ -38,14 +424,13 @@ def xls_search(file_path, text):
     return matches
 
 
-
 def is_log_file(file_path):
     """Determine if a file is a log file based on naming patterns."""
     file_name = os.path.basename(file_path)
 
-    # Handle gzipped files
-    if file_name.endswith('.gz'):
-        file_name = file_name[:-3]  # Remove .gz extension
+    # Handle compressed files
+    if file_name.endswith(COMPRESSED_FORMATS):
+        file_name = os.path.splitext(file_name)[0]  # Remove .gz, .xz, ... extension
 
     # Check for exact filenames without extensions
     if file_name.startswith(('messages', 'syslog', 'dmesg')):
@@ -67,8 +452,27 @@ def is_log_file(file_path):
 
     return False
 
+def is_archive(file_path):
+    """Determine if a file is a .zip or .tar archive, from its name."""
+    return file_path.lower().endswith(ARCHIVE_FORMATS)
+
+def file_type(file_path):
+    """Return the type a file is counted under, or None if it is not searched."""
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in SKIPPED_FORMATS:
+        return None
+    if is_archive(file_path):
+        return 'archive'
+    if is_log_file(file_path):
+        return 'log'
+    return extension
+
 def test_is_log_file():
-    """Test the is_log_file function with various filenames and expected results."""
+    """Test the is_log_file function with various filenames and expected results.
+
+    Also tests which type each of a few compressed logs and archives is
+    searched as: a log in an archive is searched as the archive.
+    """
     test_cases = {
         # Original test cases
         'messages': True,
@@ -94,8 +498,21 @@ def test_is_log_file():
         'wsrunner_RenderXBrowserAPI.log-2019-03-15-13-1.gz': True,
         'messages.99.gz': True,
         'syslog.20220811.1660267021.gz': True,
+        'x.log.bz2': True,
+        'x.log.xz': True,
+        'x.log.zst': True,
         'jessie.blog': False
     }
+    type_cases = {
+        'x.log.gz': 'log',
+        'x.log.bz2': 'log',
+        'x.log.xz': 'log',
+        'x.log.zst': 'log',
+        'x.log.tar.gz': 'archive',
+        'messages.1.tgz': 'archive',
+        'x.zip': 'archive',
+        'x.docx': '.docx',
+    }
 
     temp_dir = "/tmp/"
 
@@ -114,6 +531,20 @@ def test_is_log_file():
             all_passed = False
         print(f"{file_name:35} | {result:6} | {expected:8} | {match}")
 
+    print("-" * 70)
+    print("Filename                            | Type     | Expected | Match?")
+    print("-" * 70)
+
+    for file_name, expected in type_cases.items():
+        file_path = os.path.join(temp_dir, file_name)
+        result = file_type(file_path)
+        file_format = format_by_name(file_path)
+        # The format it is searched in must agree with the type it is counted under.
+        match = result == expected and file_format is not None and file_format.name in (result, result[1:])
+        if not match:
+            all_passed = False
+        print(f"{file_name:35} | {result:8} | {expected:8} | {match}")
+
     print("-" * 70)
     if all_passed:
         print("All tests passed!")
@@ -121,80 +552,358 @@ def test_is_log_file():
         print("Some tests failed. Check your implementation.")
 
 
+def gzip_blocks(file, block_size=LOG_BLOCK_SIZE):
+    """Yield the decompressed data of a gzip file, about block_size bytes at a time.
+
+    The file is read and inflated by zlib in large blocks rather than line
+    by line.  Files made of several gzip members one after another (as
+    written by concatenating logs) are read to the end.
+    """
+    decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)  # Expect a gzip header
+    while True:
+        data = file.read(block_size)
+        if not data:
+            return
+        while data:
+            block = decompressor.decompress(data, block_size)
+            if block:
+                yield block
+            if decompressor.eof:
+                # Start on the next member; trailing zero padding is ignored.
+                data = decompressor.unused_data.lstrip(b'\x00')
+                decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+            else:
+                data = decompressor.unconsumed_tail
+
+
+def scan_lines(blocks, terms):
+    """Yield (line_num, line) for each line in blocks of bytes with a match for the terms.
+
+    Each term is looked for in each block as a whole; lines are only split
+    out (and counted) around the matches, so the lines without a match are
+    never handled one at a time.  terms must not be a regex, nor contain a
+    line break.
+    """
+    fold = not terms.case_sensitive
+    patterns = terms.folded_byte_patterns()
+    line_num = 1  # Number of the line at the start of data.
+    tail = b''
+    for block in itertools.chain(blocks, [None]):
+        if block is None:
+            data, tail = tail, b''
+        else:
+            data = tail + block
+            # Only search whole lines; the last partial line waits for the next block.
+            cut = data.rfind(b'\n') + 1
+            data, tail = data[:cut], data[cut:]
+        haystack = data.lower() if fold else data
+        lines = {}  # Start and end of each line with a match.
+        for pattern in patterns:
+            pos = 0
+            while True:
+                match = pattern.search(haystack, pos)
+                if match is None:
+                    break
+                start = data.rfind(b'\n', 0, match.start()) + 1
+                end = data.find(b'\n', match.end())
+                pos = lines[start] = len(data) if end < 0 else end + 1
+
+        pos = 0  # Where line_num was counted up to.
+        for start in sorted(lines):
+            line_num += data.count(b'\n', pos, start)
+            pos = lines[start]
+            yield line_num, data[start:pos]
+            line_num += 1
+        line_num += data.count(b'\n', pos)
+
+
+def compression(magic):
+    """Return the compression ('gzip', 'bzip2', 'xz' or 'zstd') that the first bytes of a file show, or None."""
+    if magic.startswith(b'\x1f\x8b'):
+        return 'gzip'
+    if magic.startswith(b'BZh') and magic[4:10] == b'\x31\x41\x59\x26\x53\x59':
+        return 'bzip2'
+    if magic.startswith(b'\xfd7zXZ\x00'):
+        return 'xz'
+    if magic.startswith(b'\x28\xb5\x2f\xfd'):
+        return 'zstd'
+    return None
+
+def open_decompressed(file):
+    """Return a binary file object that reads file (open in binary mode) decompressed.
+
+    The compression is recognised from the magic bytes at the start of the
+    file: gzip, bzip2, xz or zstd (which needs the zstandard package).
+    Anything else is returned as it is.  The file must support peek(), as
+    files opened with open(), and archive members, do.
+    """
+    kind = compression(file.peek(10)[:10])
+    if kind == 'gzip':
+        return gzip.GzipFile(fileobj=file)
+    if kind == 'bzip2':
+        return bz2.BZ2File(file)
+    if kind == 'xz':
+        return lzma.LZMAFile(file)
+    if kind == 'zstd':
+        if zstandard is None:
+            raise ImportError("zstandard required for .zst files: python -m pip install zstandard")
+        return zstandard.ZstdDecompressor().stream_reader(file, read_across_frames=True)
+    return file
+
+def sniff(file_path):
+    """Return what the first SNIFF_SIZE bytes of a file say it holds.
+
+    One of 'zip', 'ole' (an OLE compound file, such as a .doc or .xls),
+    'pdf', 'compressed', 'text', 'binary', or 'empty'.  A file is taken as
+    binary if it has a NUL byte and no byte order mark, as grep does.
+    """
+    with open(file_path, 'rb') as file:
+        head = file.read(SNIFF_SIZE)
+    if not head:
+        return 'empty'
+    if head.startswith((b'PK\x03\x04', b'PK\x05\x06')):
+        return 'zip'
+    if head.startswith(OLE_SIGNATURE):
+        return 'ole'
+    if b'%PDF-' in head[:1024]:  # The header may follow some junk.
+        return 'pdf'
+    if compression(head):
+        return 'compressed'
+    if b'\0' in head and not head.startswith(TEXT_BOMS):
+        return 'binary'
+    return 'text'
+
+
+def search_log_lines(file, text):
+    """Yield (line_num, line) for each line of a log with a match, highlighting the matches.
+
+    file is open in binary mode and may be compressed; see
+    open_decompressed().
+    """
+    terms = as_terms(text)
+    if not terms.regex and not any('\n' in term or '\r' in term for term in terms.terms):
+        # Match the raw (decompressed) bytes a block at a time and only
+        # decode the lines with a match.
+        if file.peek(2)[:2] == b'\x1f\x8b':  # GZip magic number
+            blocks = gzip_blocks(file)
+        else:
+            blocks = iter(functools.partial(open_decompressed(file).read, LOG_BLOCK_SIZE), b'')
+        for line_num, line in scan_lines(blocks, terms):
+            # Highlight the matched text within the line
+            yield line_num, terms.highlight(line.decode('utf-8', 'ignore')).strip()
+        return
+
+    # Regular expressions are written for text, so read the lines as text.
+    lines = io.TextIOWrapper(open_decompressed(file), encoding='utf-8', errors='ignore')
+    for line_num, line in enumerate(lines, start=1):
+        if terms.search(line):
+            yield line_num, terms.highlight(line).strip()
+
+
 def log_search(file_path, text, context_chars=32, case_sensitive=False):
-    """Search in log files, handling gzipped files if necessary."""
+    """Search in log files, handling compressed files if necessary."""
     matches = []
-    search_text = text if case_sensitive else text.lower()
+    terms = as_terms(text, case_sensitive)
 
     try:
-        # Check file magic bytes to determine if it's gzipped
-        is_gzipped = False
-        with open(file_path, 'rb') as test_file:
-            magic_bytes = test_file.read(2)
-            if magic_bytes == b'\x1f\x8b':  # GZip magic number
-                is_gzipped = True
-
-        # Choose the appropriate file opener based on whether the file is gzipped
-        opener = gzip.open if is_gzipped else open
-        # open_mode = 'rt' if is_gzipped else 'r'
-
-        # Use the selected opener with a single code path for both file types
-        with opener(file_path, 'rt', encoding='utf-8', errors='ignore') as file:
-            for line_num, line in enumerate(file, start=1):
-                line_text = line if case_sensitive else line.lower()
-                if search_text in line_text:
-                    # Highlight the matched text within the line
-                    highlighted_line = line.replace(text, f"[MATCH: {text}]")
-                    matches.append(f"Line {line_num}: {highlighted_line.strip()}")
-
+        with open(file_path, 'rb') as file:
+            for line_num, line in search_log_lines(file, terms):
+                if not terms.add(matches, f"Line {line_num}: {line}"):
+                    break
         return matches
     except Exception as e:
         return [f"Error processing {file_path}: {str(e)}"]
 
 
-def binary_search(file_path, text, context_chars=32):
+def archive_members(file_path):
+    """Yield (name, file) for each log or text file in a .zip or .tar archive.
+
+    The members are read straight from the archive, one after another,
+    without extracting them to disk; a .tar may be compressed in any of the
+    ways open_decompressed() understands.  A zip is told from a tar by its
+    contents, as sniff_format() may send a zip with any name here.
+    """
+    def wanted(name):
+        return is_log_file(name) or os.path.splitext(name)[1].lower() in TEXT_FORMATS
+
+    if zipfile.is_zipfile(file_path):
+        with zipfile.ZipFile(file_path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and wanted(info.filename):
+                    with archive.open(info) as member:
+                        yield info.filename, member
+        return
+    with open(file_path, 'rb') as file:
+        # Members are read in order, so a compressed .tar is only ever
+        # decompressed forwards, never buffered or rewound.
+        with tarfile.open(fileobj=open_decompressed(file), mode='r:') as archive:
+            for info in archive:
+                if info.isfile() and wanted(info.name):
+                    yield info.name, archive.extractfile(info)
+
+
+def archive_search(file_path, text):
+    """Search the log and text files inside an archive, reporting matches as archive!member:line.
+
+    An archive that can't be read raises, for the search to report.
+    """
+    matches = []
+    terms = as_terms(text)
+    archive_name = os.path.basename(file_path)
+    for name, member in archive_members(file_path):
+        for line_num, line in search_log_lines(member, terms):
+            if not terms.add(matches, f"{archive_name}!{name}:{line_num}: {line}"):
+                return matches
+    return matches
+
+
+def binary_search(file_path, text, context_chars=32, chunk_size=BINARY_CHUNK_SIZE):
+    """Search a text file for all occurrences of text, ignoring case.
+
+    The file is read chunk_size characters at a time; only the unsearched
+    tail of the previous chunk (enough for a match that crosses the chunk
+    boundary plus its context) is carried over, so memory use doesn't grow
+    with the size of the file.
+    """
     matches = []
-    text_lower = text.lower()  # Convert search text to lowercase for case-insensitive search
+    terms = as_terms(text)
+    if terms.empty:
+        return matches
+
+    buffer = ''      # Text that may still hold (the context of) a match
+    search_from = 0  # Position in buffer to look for the next match from
 
     # Open and read the file as text
     with open(file_path, 'rt', encoding='utf8', errors='ignore') as file:
-        data = file.read().lower()  # Convert the entire content to lowercase for case-insensitive matching
+        while True:
+            chunk = file.read(chunk_size)
+            at_end = not chunk
+            buffer += chunk
+
+            while True:
+                match = terms.search(buffer, search_from)  # Find the next occurrence
+                if match is None:
+                    # A match can still start in the last max_length - 1 characters.
+                    search_from = max(search_from, len(buffer) - terms.max_length + 1)
+                    break
+                pos = match.start()
+                end = match.end() + context_chars
+                if end > len(buffer) and not at_end:
+                    search_from = pos  # Wait for the rest of the match and its context
+                    break
+
+                # Extract a portion of text around the match for context
+                start = max(pos - context_chars, 0)
+                context = buffer[start:end].lower()  # Get the context string
+
+                # Highlight the matched text within the context
+                highlighted_match = terms.highlight(context)
+
+                # Append the context with the matched text
+                if not terms.add(matches, f"CONTEXT: '{highlighted_match}'"):
+                    return matches
+                search_from = max(match.end(), pos + 1)
+
+            if at_end:
+                break
+            # Drop everything before the leading context of the next match.
+            drop = max(search_from - context_chars, 0)
+            buffer = buffer[drop:]
+            search_from -= drop
+
+    return matches
+
+
+@functools.lru_cache(maxsize=32)
+def byte_pattern(text):
+    """Compile a case-insensitive regular expression that finds text in UTF-8 bytes.
 
-    pos = data.find(text_lower)  # Find the first occurrence
-    while pos >= 0:
-        # Extract a portion of text around the match for context
-        start = max(pos - context_chars, 0)
-        end = min(pos + len(text_lower) + context_chars, len(data))
-        context = data[start:end]  # Get the context string
+    re.IGNORECASE only folds ASCII letters in a bytes pattern, which is all
+    an ASCII term needs.  Each non-ASCII character is instead matched as any
+    of the UTF-8 encodings of its upper and lower case forms.
+    """
+    if text.isascii():
+        return re.compile(re.escape(text.encode('ascii')), re.IGNORECASE)
+    parts = []
+    for char in text:
+        if char.isascii():
+            parts.append(re.escape(char.encode('ascii')))
+        else:
+            # Only forms that lowercase back to the same text, like str.lower().
+            forms = sorted({form for form in (char, char.lower(), char.upper(), char.title())
+                            if form.lower() == char.lower()}, key=len, reverse=True)
+            parts.append(b'(?:' + b'|'.join(re.escape(form.encode('utf-8')) for form in forms) + b')')
+    return re.compile(b''.join(parts), re.IGNORECASE)
 
-        # Highlight the matched text within the context
-        highlighted_match = context.replace(text_lower, f"[MATCH: {text}]")
 
-        # Append the context with the matched text
-        matches.append(f"CONTEXT: '{highlighted_match}'")
+def universal_newlines(text):
+    """Translate \\r\\n and \\r line endings to \\n, as reading in text mode does."""
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+
+def mmap_search(file_path, text, context_chars=32):
+    """Search a text file by memory-mapping it and matching the raw bytes.
+
+    Unlike binary_search(), the file is never decoded or lowercased as a
+    whole; only the few bytes around each match are decoded to build its
+    context.  Results are in the same format as binary_search().
+    """
+    matches = []
+    terms = as_terms(text)
+    if terms.empty:
+        return matches
+    pattern = terms.byte_pattern()
+    if pattern is None:
+        # Regular expressions are written for text, not UTF-8 bytes.
+        return binary_search(file_path, terms, context_chars)
+    # Enough bytes to hold context_chars characters of UTF-8 on either side.
+    window = context_chars * 4
 
-        # Find the next occurrence
-        pos = data.find(text_lower, pos + len(text_lower))
+    with open(file_path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return matches  # Empty files can't be mapped.
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for match in pattern.finditer(data):
+                start, end = match.span()
+                before = universal_newlines(data[max(start - window, 0):start].decode('utf8', 'ignore'))
+                after = universal_newlines(data[end:end + window].decode('utf8', 'ignore'))
+                context = (before[max(len(before) - context_chars, 0):] + match.group().decode('utf8', 'ignore') +
+                           after[:context_chars]).lower()
+
+                # Highlight the matched text within the context
+                highlighted_match = terms.highlight(context)
+                if not terms.add(matches, f"CONTEXT: '{highlighted_match}'"):
+                    break
 
-    # return "\n".join(matches)
     return matches
 
 
 # .doc, .dot
 def mbcs_search(file_path, text):
-    """Search for raw text encoded as UTF-16."""
+    """Search for raw text encoded as UTF-16.
+
+    At most max_matches positions (one with files_only) are found for each
+    term; combined_search() applies the limit to them all together.
+    """
     matches = []
-    utf16_text = text.lower().encode('utf-16')[2:]
+    terms = as_terms(text)
+    if terms.regex:
+        return matches  # Only literal terms can be looked for as raw UTF-16.
 
     with open(file_path, 'rb') as file:
         data = file.read().lower()
 
-    pos = data.find(utf16_text)
-    while pos >= 0:
-        matches.append({"position": pos})
-        pos = data.find(utf16_text, pos + len(utf16_text))
+    limit = 1 if terms.files_only else terms.max_matches
+    for term in terms.terms:
+        utf16_text = term.lower().encode('utf-16')[2:]
+        pos = data.find(utf16_text)
+        found = 0
+        while pos >= 0 and found != limit:
+            matches.append({"position": pos, "term": term})
+            found += 1
+            pos = data.find(utf16_text, pos + len(utf16_text))
 
-    return matches
+    return sorted(matches, key=lambda match: match["position"])
 
 # def combined_search(file_path, text):
 #     """Perform both mbcs_search and binary_search on the file."""
@@ -210,48 +919,75 @@ def mbcs_search(file_path, text):
 def combined_search(file_path, text):
     """Perform both mbcs_search and binary_search on the file."""
     try:
-        matches_mbcs = mbcs_search(file_path, text)
+        text = as_terms(text)
+        matches = []
+        label = (lambda match: f" | Term: {match['term']}") if text.multiple else (lambda match: "")
+        for match in mbcs_search(file_path, text):
+            if not text.add(matches, f"UTF-16 Match at position: {match['position']}{label(match)}"):
+                return matches
 
         # binary_search returns strings, not dictionaries with 'position' key
         # So we need to handle these separately
-        matches_binary = binary_search(file_path, text)
-
-        # Just return the formatted matches
-        if matches_mbcs:
-            mbcs_results = [f"UTF-16 Match at position: {match['position']}" for match in matches_mbcs]
-            return mbcs_results + matches_binary
-        else:
-            return matches_binary
+        for match in binary_search(file_path, text):
+            if not text.add(matches, match):
+                break
+        return matches
     except Exception as e:
         return [f"Error in combined_search for {file_path}: {str(e)}"]
 
+def extract_doc_text(file_path):
+    """Return the paragraphs of a Word 97-2003 .doc or .dot file as (location, text) chunks.
 
-# .docm
-def extract_text_from_docx_element(element):
+    Paragraphs outside the main document are located by their story, as in
+    'Footnotes | Paragraph: 2'.  Raises ValueError if msdoc can't read the file.
     """
-    Recursively extracts text from a docx2python element,
-    handling nested lists and concatenating text content.
+    chunks = []
+    for story, paragraphs in msdoc.doc_paragraphs(file_path):
+        prefix = f"{story} | " if story else ""
+        chunks.extend((f"{prefix}Paragraph: {i + 1}", paragraph)
+                      for i, paragraph in enumerate(paragraphs) if paragraph)
+    return chunks
+
+def doc_search(file_path, text):
+    """Search the paragraphs of a .doc or .dot file, read from its text streams alone.
+
+    Files that aren't Word 97-2003 documents (Word 95 and older, encrypted
+    documents, or RTF or HTML saved as .doc) are searched as raw bytes with
+    combined_search() instead.
     """
-    if isinstance(element, list):
-        return '\n'.join([extract_text_from_docx_element(item) for item in element])
-    elif isinstance(element, str):
-        return element
-    else:
-        return ''
+    try:
+        matches = []
+        terms = as_terms(text)
+        try:
+            chunks = cached_text(file_path, 'doc', extract_doc_text)
+        except ValueError:
+            return combined_search(file_path, terms)
+        for location, paragraph in find_chunks(chunks, terms):
+            for detail in paragraph_details(location, paragraph, terms):
+                if not terms.add(matches, detail):
+                    return matches
+        return matches
+    except Exception as e:
+        print(f"Error processing file {file_path}: {e}")
+        return []
+
+
+# .docm
+def extract_docm_text(file_path):
+    """Return the paragraphs of a .docm file, including those in tables, as (location, text) chunks."""
+    return [(f"Paragraph: {i + 1}", paragraph)
+            for i, paragraph in enumerate(ooxml.docx_paragraphs(file_path, nested=True))
+            if paragraph]
 
 def docm_python_search(file_path, text):
     try:
-        result = docx2python(file_path)
-        # Extracting text properly from the docx2python result object, handling nested structures
-        text_content = extract_text_from_docx_element(result.body)
-        text_content = text_content.lower()
         matches = []
-        start = 0
-        while start != -1:
-            start = text_content.find(text.lower(), start)
-            if start != -1:
-                matches.append({"position": start})
-                start += len(text)
+        terms = as_terms(text)
+        chunks = cached_text(file_path, 'docm', extract_docm_text)
+        for location, paragraph in find_chunks(chunks, terms):
+            for detail in paragraph_details(location, paragraph, terms):
+                if not terms.add(matches, detail):
+                    return matches
         return matches
     except Exception as e:
         print(f"Error processing file {file_path}: {e}")
@@ -259,17 +995,21 @@ def docm_python_search(file_path, text):
 
 
 # .docx
+def extract_docx_text(file_path):
+    """Return the paragraphs of a .docx file as (location, text) chunks."""
+    return [(f"Paragraph: {i + 1}", paragraph)
+            for i, paragraph in enumerate(ooxml.docx_paragraphs(file_path)) if paragraph]
+
 """ return paragraph number """
 def docx_python_search(file_path, text):
     try:
-        doc = Document(file_path)
         matches = []
-        search_text_lower = text.lower()
-
-        for i, paragraph in enumerate(doc.paragraphs):
-            if search_text_lower in paragraph.text.lower():
-                matches.append(f"Paragraph: {i + 1} | Text: {paragraph.text}")
-
+        terms = as_terms(text)
+        chunks = cached_text(file_path, 'docx', extract_docx_text)
+        for location, paragraph in find_chunks(chunks, terms):
+            for detail in paragraph_details(location, paragraph, terms):
+                if not terms.add(matches, detail):
+                    return matches
         return matches
     except Exception as e:
         print(f"Error processing file {file_path}: {e}")
@@ -277,82 +1017,513 @@ def docx_python_search(file_path, text):
 
 """ return page number (failed)"""
 
+def extract_xlsx_text(file_path):
+    """Return the non-empty cells of an .xlsx file as (location, value) chunks."""
+    chunks = []
+    with ooxml.Workbook(file_path) as workbook:
+        for sheet_name, part_name in workbook.sheets:
+            for coordinate, value in workbook.cells(part_name):
+                if value:
+                    chunks.append((f"Sheet: '{sheet_name}' | Cell: {coordinate}", str(value)))
+    return chunks
+
+def may_be_number_text(term):
+    """Return whether a term could be part of the text of a number, date, time or boolean cell.
+
+    Those cells hold a number in the sheet XML, and only become text such
+    as "2024-01-31 12:00:00" when they are read.
+    """
+    term = term.lower()
+    words = re.findall('[a-z]+', term)
+    return (set(re.sub('[a-z]+', '', term)) <= NUMBER_CHARACTERS
+            and all(any(word in number_word for number_word in NUMBER_WORDS) for word in words))
+
+def is_xml_literal(term):
+    """Return whether a term is always written as it is in the XML of a workbook.
+
+    Such a term can only be in a string if it's in the raw bytes of the XML
+    part; others may be escaped, as &amp; or _x000D_ say.
+    """
+    return term.isprintable() and not any(char in term for char in '&<>"\'') and '_x' not in term.lower()
+
+def part_has_terms(package, part_name, terms):
+    """Return whether any of the terms may be in the strings of a workbook XML part.
+
+    The raw bytes of the part are searched a block at a time without parsing
+    the XML.  A part with rich text always may, since a term could be split
+    between the runs of a string.
+    """
+    fold = not terms.case_sensitive
+    patterns = terms.folded_byte_patterns()
+    # A term may straddle two blocks.
+    overlap = max(len(term.encode('utf-8')) for term in terms.terms) - 1
+    tail = b''
+    with package.open(part_name) as part:
+        while True:
+            block = part.read(ooxml.XML_BLOCK_SIZE)
+            if not block:
+                return False
+            data = tail + block
+            haystack = data.lower() if fold else data
+            if (any(pattern.search(haystack) for pattern in patterns)
+                    or any(run in data for run in RICH_TEXT_RUNS)):
+                return True
+            tail = data[len(data) - overlap:] if overlap else b''
+
+def xlsx_matching_cells(file_path, terms):
+    """Yield the (location, value) chunks of the cells of an .xlsx file that have a match.
+
+    Most of the text of a workbook is in its shared string table, so that is
+    searched first, and the sheets are then read for the cells that refer to
+    a matching string or hold other text.  Number, date and boolean cells are
+    only read when a term could be part of their text, and a sheet is skipped
+    without being parsed when no shared string matched and a scan of its raw
+    XML shows no term could be in its other cells.  Once the workbook may
+    have a match, the chunks come from the text cache instead if it's there.
+    The cells are matched a batch at a time with matching_strings(), and
+    only the locations of the matches are formatted.
+    """
+    literal = not terms.regex and all(is_xml_literal(term) for term in terms.terms)
+    numbers = terms.regex or any(may_be_number_text(term) for term in terms.terms)
+    with ooxml.Workbook(file_path) as workbook:
+        wanted = set()
+        if workbook.strings_part in workbook.package.NameToInfo:
+            if not literal or part_has_terms(workbook.package, workbook.strings_part, terms):
+                wanted = set(matching_strings(workbook.strings, terms))
+        sheets = [(sheet_name, part_name) for sheet_name, part_name in workbook.sheets
+                  if wanted or numbers or not literal or part_has_terms(workbook.package, part_name, terms)]
+        if not sheets:
+            return
+        chunks = cached_chunks(file_path, 'xlsx')
+        if chunks is not None:
+            yield from find_cells(chunks, terms)
+            return
+        for sheet_name, part_name in sheets:
+            cells = workbook.cells(part_name, wanted, numbers)
+            while batch := list(itertools.islice(cells, CELL_BATCH_SIZE)):
+                values = [str(value) if value else '' for coordinate, value in batch]
+                for index in matching_strings(values, terms):
+                    yield f"Sheet: '{sheet_name}' | Cell: {batch[index][0]}", values[index]
+
 def xlsx_search(file_path, text) -> list[str]:
     """Search XLSX file and return a list with descriptions of each match, including cell content."""
     try:
-        workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
         matches = []
-        text_lower = text.lower()
-        for sheet_name in workbook.sheetnames:
-            worksheet = workbook[sheet_name]
-            for row in worksheet.iter_rows():
-                for cell in row:
-                    if cell.value and text_lower in str(cell.value).lower():
-                        matches.append(f"Sheet: '{sheet_name}' | Cell: {cell.coordinate} | Content: {cell.value}")
+        terms = as_terms(text)
+        for location, value in xlsx_matching_cells(file_path, terms):
+            for detail in content_details(location, value, terms):
+                if not terms.add(matches, detail):
+                    return matches
         return matches
     except Exception as e:
         print(f"Error processing file {file_path}: {e}")
         return []
 
 
-def pdf_search(file_path, text, context_chars=32):
+def page_range(page_count, part=None):
+    """Return the range of page numbers in part (i, n) of a document, or all of them."""
+    if part is None:
+        return range(page_count)
+    index, parts = part
+    return range(page_count * index // parts, page_count * (index + 1) // parts)
+
+def pdf_pages(file_path, part=None):
+    """Yield the text of each page of a PDF as (location, text) chunks.
+
+    With part=(i, n), only the i-th of n runs of pages is read, so a large
+    PDF can be shared between worker processes.  The text is kept in the
+    text cache page by page, and PyMuPDF is only opened for pages that
+    aren't cached yet; a search that stops early never reads the rest.
+    """
+    cache = get_cache()
+    stat = os.stat(file_path)
+
+    def cached(kind):
+        return cache.get(file_path, kind, stat.st_size, stat.st_mtime_ns) if cache else None
+
+    def store(kind, chunks):
+        if cache:
+            cache.put(file_path, kind, stat.st_size, stat.st_mtime_ns, chunks)
+
+    doc = None
+    try:
+        page_count = cached('pdf-pages')
+        if page_count is None:
+            doc = fitz.open(file_path)
+            page_count = len(doc)
+            store('pdf-pages', [("Pages", page_count)])
+        else:
+            page_count = page_count[0][1]
+        for page_num in page_range(page_count, part):
+            kind = f"pdf-page:{page_num + 1}"
+            chunks = cached(kind)
+            if chunks is None:
+                if doc is None:
+                    doc = fitz.open(file_path)
+                page = doc.load_page(page_num)  # Load the page
+                chunks = [(f"Page {page_num + 1}", page.get_text("text"))]
+                store(kind, chunks)
+            yield chunks[0]
+    finally:
+        if doc is not None:
+            doc.close()
+
+def extract_pdf_text(file_path):
+    """Return the text of each page of a PDF as (location, text) chunks."""
+    return list(pdf_pages(file_path))
+
+def pdf_search(file_path, text, context_chars=32, part=None):
+    """Search the pages of a PDF, or part (i, n) of them; see pdf_pages()."""
     try:
-        doc = fitz.open(file_path)  # Open the PDF document
         matches = []
-        text_lower = text.lower()  # Convert search text to lowercase
+        terms = as_terms(text)
 
-        # Iterate through each page of the document
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)  # Load the page
-            page_text = page.get_text("text").lower()  # Get all text content from the page in lowercase
+        # Iterate through each page of the document, reading pages only
+        # until enough matches have been found
+        for location, page_text in find_chunks(pdf_pages(file_path, part), terms):
+            # Add every occurrence of the terms on the page, with its context
+            for detail in page_details(location, page_text, terms, context_chars):
+                if not terms.add(matches, detail):
+                    return matches
 
-            # Search for all occurrences of the term in the page
-            start_pos = page_text.find(text_lower)
-            while start_pos != -1:
-                # Extract context around the match
-                start_context = max(0, start_pos - context_chars)
-                end_context = min(len(page_text), start_pos + len(text_lower) + context_chars)
-                context = page_text[start_context:end_context]
+        return matches  # Return all matches found
+    except Exception as e:
+        print(f"Error processing file {file_path}: {e}")
+        return []
 
-                # Append the match along with the page number
-                matches.append(f"Page {page_num + 1}:\n{context.strip()}\n")
 
-                # Find the next occurrence on the page
-                start_pos = page_text.find(text_lower, start_pos + len(text_lower))
+def pdf_hit_search(file_path, text, part=None):
+    """Search a PDF with PyMuPDF's own page search, instead of extracting its text.
 
-        doc.close()  # Close the document
-        # print("\n".join(matches))
-        return matches  # Return all matches found
+    MuPDF finds the hits on each page (ignoring case), and only the line
+    around each hit is extracted for its context, so no page's text is
+    copied or lowercased as a whole.  Each match ends with the rectangle of
+    the hit on the page, as " | Rect: x0, y0, x1, y1" in points, for a
+    viewer to highlight.  Regular expressions and case sensitive terms are
+    searched with pdf_search() instead.
+    """
+    terms = as_terms(text)
+    if terms.regex or terms.case_sensitive:
+        return pdf_search(file_path, terms, part=part)
+    try:
+        matches = []
+        doc = fitz.open(file_path)
+        try:
+            for page_num in page_range(len(doc), part):
+                page = doc.load_page(page_num)
+                textpage = page.get_textpage()  # Shared by every term and context.
+                hits = [(rect, term) for term in terms.terms
+                        for rect in page.search_for(term, textpage=textpage)]
+                hits.sort(key=lambda hit: (hit[0].y0, hit[0].x0))  # Reading order
+                for rect, term in hits:
+                    # The text of the whole width of the page, on the hit's line.
+                    line = fitz.Rect(page.rect.x0, rect.y0, page.rect.x1, rect.y1)
+                    context = page.get_textbox(line, textpage=textpage).strip().lower()
+                    if terms.multiple:
+                        context = f"{terms.highlight(context)} | Term: {term}"
+                    position = ", ".join(f"{value:.1f}" for value in rect)
+                    if not terms.add(matches, f"Page {page_num + 1}:\n{context}\n | Rect: {position}"):
+                        return matches
+        finally:
+            doc.close()
+        return matches
     except Exception as e:
         print(f"Error processing file {file_path}: {e}")
         return []
 
 
 
+def vsdx_shapes(file_path):
+    """Yield the text of every shape in a Visio drawing as (page and shape ID, text) chunks."""
+    with ooxml.Drawing(file_path) as drawing:
+        for page_name, part_name in drawing.pages:
+            for shape_id, text in drawing.shapes(part_name):
+                yield f"Page: {page_name} | Shape: {shape_id}", text
+
+def extract_vsdx_text(file_path):
+    """Return the text of every shape in a Visio drawing as (page and shape ID, text) chunks."""
+    return list(vsdx_shapes(file_path))
+
 def vsdx_search(file_path, search_text):
-    matches = set()  # Using a set to store unique page names
+    """Search the shapes of a Visio drawing as its pages are read and return the page and shape ID of each match."""
+    try:
+        matches = []
+        terms = as_terms(search_text)
+        chunks = cached_chunks(file_path, 'vsdx-shapes')
+        if chunks is None:
+            chunks = caching_chunks(file_path, 'vsdx-shapes', vsdx_shapes(file_path))
+        for location, shape_text in find_chunks(chunks, terms):
+            for detail in shape_details(location, shape_text, terms):
+                if not terms.add(matches, detail):
+                    return matches
+        return matches
+    except Exception as e:
+        print(f"Error processing file {file_path}: {e}")
+        return []
+
+
+def iter_lines(file, location="Line "):
+    """Yield the non-blank lines of a binary file (which may be compressed) as (location, text) chunks."""
+    lines = io.TextIOWrapper(open_decompressed(file), encoding='utf-8', errors='ignore')
+    for line_num, line in enumerate(lines, start=1):
+        if line.strip():
+            yield f"{location}{line_num}", line.rstrip('\r\n')
+
+def search_parts(file_path, workers):
+    """Return how many parts to split the search of a file into (1 to not split it).
+
+    Only formats that can be SPLIT (PDFs) are split, into parts of at least
+    PDF_PART_PAGES pages and at most one per worker; each part is a run of
+    pages (see pdf_pages()).  It is the number of pages that counts, not the
+    size: a 500 page manual of text may be a few MB, while a few scanned
+    pages can be far bigger.  This runs as files are handed out, so the
+    format is taken from the file's name alone, and only PDFs of
+    PDF_SPLIT_SIZE bytes or more are opened to count their pages (which
+    only reads the PDF's cross-reference table, in a few milliseconds).
+    """
+    file_format = format_by_name(file_path)
+    if workers <= 1 or file_format is None or SPLIT not in file_format.capabilities:
+        return 1
+    try:
+        if os.path.getsize(file_path) < PDF_SPLIT_SIZE:
+            return 1
+        with fitz.open(file_path) as doc:
+            page_count = len(doc)
+    except Exception:
+        return 1  # Left for the search to report.
+    return max(1, min(workers, page_count // PDF_PART_PAGES))
+
+def merge_parts(part_matches, text):
+    """Join the matches from the parts of a file, in order, within the terms' limits."""
+    terms = as_terms(text)
+    matches = []
+    for match in itertools.chain.from_iterable(part_matches):
+        if not terms.add(matches, match):
+            break
+    return matches
+
+
+def iter_file_lines(file_path):
+    """Yield the non-blank lines of a text or log file as (location, text) chunks."""
+    with open(file_path, 'rb') as file:
+        yield from iter_lines(file)
+
+def extract_lines(file_path):
+    """Return the non-blank lines of a text or log file as (location, text) chunks."""
+    return list(iter_file_lines(file_path))
 
-    with VisioFile(file_path) as visio:
-        # Function to recursively search through shapes and their sub-shapes
-        def search_shapes(shapes, page_name):
-            for shape in shapes:
-                shape_text = shape.text
-                if shape_text and search_text.lower() in shape_text.lower():
-                    matches.add(page_name)  # Add the page name to the set
-                    return  # Stop searching this page as we've found a match
+def iter_archive_lines(file_path):
+    """Yield the lines of the log and text files in an archive, located as archive!member:line."""
+    archive_name = os.path.basename(file_path)
+    for name, member in archive_members(file_path):
+        yield from iter_lines(member, f"{archive_name}!{name}:")
+
+
+def pdf_file_search(file_path, text, part=None):
+    """Search a PDF, or part of one, with pdf_hit_search() if the terms ask for hits, or else pdf_search()."""
+    text = as_terms(text)
+    if text.pdf_hits:
+        return pdf_hit_search(file_path, text, part=part)
+    return pdf_search(file_path, text, part=part)
+
+def extract_doc_file(file_path):
+    """Return the paragraphs of a .doc or .dot file, or its lines if msdoc can't read it."""
+    try:
+        return cached_text(file_path, 'doc', extract_doc_text)
+    except ValueError:
+        # Not a Word 97-2003 document: indexed the way binary_search() reads it.
+        return extract_lines(file_path)
+
+def cached_extractor(kind, extract):
+    """Return an extractor that keeps the chunks from extract() in the text cache as kind."""
+    return functools.partial(cached_text, kind=kind, extract=extract)
+
+
+# Cost classes of the file formats, from the cheapest to read per byte; the
+# engine hands out the cheaper files first, see file_cost().
+COST_SCAN = 1    # Matched as raw bytes or lines, a block at a time.
+COST_PARSE = 2   # Parsed to find the parts of the file that hold text.
+COST_RENDER = 3  # Laid out page by page to get its text.
+# Capabilities of the file formats.
+SPLIT = 'split'    # A large file can be searched in parts on several workers; see search_parts().
+STREAM = 'stream'  # extract() yields the chunks as it reads the file; see stream_file().
+
+
+class FileFormat:
+    """A kind of file that can be searched: how it is recognised, searched and indexed.
+
+    search(file_path, text) searches a file, with part=(i, n) as well for
+    formats that can be SPLIT, and extract(file_path) returns its text as
+    (location, text) chunks for the index.  details(location, text, terms)
+    yields the details of the matches in a chunk, as search() reports them.
+    signature is what sniff() says a file in this format holds, or None for
+    text files and logs, which have no signature; see sniff_format().  cost
+    is the format's cost class (COST_SCAN, COST_PARSE or COST_RENDER).
+    """
+    def __init__(self, name, search, extract, details, signature=None, cost=COST_PARSE, capabilities=()):
+        self.name = name
+        self.search = search
+        self.extract = extract
+        self.details = details
+        self.signature = signature
+        self.cost = cost
+        self.capabilities = frozenset(capabilities)
+
+    def __repr__(self):
+        return f"FileFormat({self.name!r})"
+
+
+FORMATS = {file_format.name: file_format for file_format in (
+    FileFormat('archive', archive_search, iter_archive_lines, line_details, cost=COST_SCAN,
+               capabilities={STREAM}),
+    FileFormat('log', log_search, iter_file_lines, line_details, cost=COST_SCAN, capabilities={STREAM}),
+    FileFormat('text', mmap_search, iter_file_lines, context_details, cost=COST_SCAN, capabilities={STREAM}),
+    FileFormat('xls', xls_search, cached_extractor('xls', extract_xls_text), value_details, 'ole'),
+    FileFormat('doc', doc_search, extract_doc_file, paragraph_details, 'ole'),
+    FileFormat('docx', docx_python_search, cached_extractor('docx', extract_docx_text), paragraph_details, 'zip'),
+    FileFormat('docm', docm_python_search, cached_extractor('docm', extract_docm_text), paragraph_details, 'zip'),
+    FileFormat('xlsx', xlsx_search, cached_extractor('xlsx', extract_xlsx_text), content_details, 'zip'),
+    FileFormat('vsdx', vsdx_search, cached_extractor('vsdx-shapes', extract_vsdx_text), shape_details, 'zip'),
+    FileFormat('pdf', pdf_file_search, extract_pdf_text, page_details, 'pdf', COST_RENDER, {SPLIT}),
+)}
+# The format of the documents with each extension.
+DOCUMENT_FORMATS = {'.xls': 'xls', '.doc': 'doc', '.dot': 'doc', '.docx': 'docx', '.docm': 'docm',
+                    '.xlsx': 'xlsx', '.vsdx': 'vsdx', '.pdf': 'pdf'}
+# The main part of each Office Open XML format, to tell them apart by their contents.
+OOXML_MAIN_PARTS = (('word/document.xml', 'docx'), ('xl/workbook.xml', 'xlsx'), ('visio/document.xml', 'vsdx'))
+
+def format_by_name(file_path):
+    """Return the FileFormat that a file's name says it is in, or None."""
+    if is_archive(file_path):
+        return FORMATS['archive']
+    if is_log_file(file_path):
+        return FORMATS['log']
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in TEXT_FORMATS:
+        return FORMATS['text']
+    name = DOCUMENT_FORMATS.get(extension)
+    return FORMATS[name] if name else None
+
+def file_cost(file_path):
+    """Return the cost class of a file, from its name alone (COST_PARSE if unknown).
+
+    It is used as files are handed out, so it must not read the file.
+    """
+    file_format = format_by_name(file_path)
+    return file_format.cost if file_format else COST_PARSE
 
-                # Recursively search sub-shapes
-                if shape.sub_shapes():
-                    search_shapes(shape.sub_shapes(), page_name)
+def format_by_contents(file_path, contents):
+    """Return the FileFormat of a zip, OLE or PDF file from what it holds, or None.
 
-        # Iterate through all pages in the Visio file
-        for page in visio.pages:
-            search_shapes(page.shapes, page.name)
+    Only the zip's directory or the OLE file's stream names are read.  A zip
+    that isn't an Office document is an archive.
+    """
+    try:
+        if contents == 'pdf':
+            return FORMATS['pdf']
+        if contents == 'zip':
+            with zipfile.ZipFile(file_path) as package:
+                names = set(package.namelist())
+            for part_name, name in OOXML_MAIN_PARTS:
+                if part_name in names:
+                    return FORMATS['docm' if 'word/vbaProject.bin' in names else name]
+            return FORMATS['archive']
+        if contents == 'ole':
+            with olefile.OleFileIO(file_path) as ole:
+                if ole.exists('WordDocument'):
+                    return FORMATS['doc']
+                if ole.exists('Workbook') or ole.exists('Book'):
+                    return FORMATS['xls']
+    except (OSError, zipfile.BadZipFile):
+        pass
+    return None
+
+def sniff_format(file_path):
+    """Return the FileFormat to search or index a file with, or None to skip it.
+
+    The format the file's name gives is checked against its first
+    SNIFF_SIZE bytes (see sniff()), so a file that won't be searched is
+    never read any further:
+    - a text file that is binary is skipped, and a text or log file that
+      is compressed is read as a compressed log; a log is read whatever
+      else it holds, as syslog and messages files can have runs of NULs
+      after an unclean shutdown;
+    - a document that holds another kind of document, or text (such as a
+      web page saved as .xls), is read as what it holds;
+    - a file without a known name is searched if it holds a PDF or an
+      Office document.
+    Archives are taken by name, since a .tar has no signature at its start.
+    """
+    by_name = format_by_name(file_path)
+    if by_name is FORMATS['archive']:
+        return by_name
+    contents = sniff(file_path)
+    if contents == 'empty':
+        return None
+    if by_name is None:
+        by_contents = format_by_contents(file_path, contents)
+        return by_contents if by_contents and by_contents.signature else None
+    if by_name.signature is None:
+        if contents == 'binary' and by_name is FORMATS['text']:
+            return None
+        if contents == 'compressed':
+            return FORMATS['log']  # Read through open_decompressed().
+        if contents in ('zip', 'ole'):
+            return format_by_contents(file_path, contents) or by_name
+        return by_name  # Text, even if it mentions %PDF- near its start.
+    if contents == by_name.signature or contents == 'binary':
+        # A binary file is left to the reader to make sense of, as a PDF with
+        # junk before its header, or an older Word document, may be.
+        return by_name
+    if contents == 'text':
+        return FORMATS['text']
+    return format_by_contents(file_path, contents)
+
+def search_file(file_path, text, part=None):
+    """Search a single file with the search function for its format; see sniff_format().
+
+    This is the unit of work handed to the search worker processes, so it
+    must stay a module level function that can be pickled.  text may be
+    a string or a SearchTerms.  part=(i, n) searches only the i-th of n
+    parts of a file that can be split (see search_parts()).
+    """
+    text = as_terms(text)
+    file_format = sniff_format(file_path)
+    if file_format is None:
+        return []
+    if SPLIT in file_format.capabilities:
+        return file_format.search(file_path, text, part=part)
+    if part is not None and part[0]:
+        return []  # Split by its name but can't be, so searched whole by the first part.
+    return file_format.search(file_path, text)
 
-    # Convert the set to a list of dictionaries
-    found_items = [page for page in matches]
+def extract_file(file_path):
+    """Return the name of a file's format and its text as a list of (location, text) chunks, for indexing.
 
-    return found_items
+    The name is None (with no chunks) for a file that isn't searched.  Like
+    search_file(), this runs in the search worker processes.
+    """
+    file_format = sniff_format(file_path)
+    if file_format is None:
+        return None, []
+    return file_format.name, list(file_format.extract(file_path))
+
+def stream_file(file_path):
+    """Return the name of the format of a large text file, log or archive and an iterator over its chunks.
+
+    The list from extract_file() is pickled back from a worker process, so a
+    multi-GB log would be held in memory several times over; files of
+    STREAM_SIZE bytes or more in a format that can STREAM are read a line at
+    a time, as the iterator is consumed, wherever they are indexed instead.
+    Compressed files count by their compressed size.  Returns None for
+    other files.
+    """
+    if os.path.getsize(file_path) < STREAM_SIZE:
+        return None
+    file_format = sniff_format(file_path)
+    if file_format is None or STREAM not in file_format.capabilities:
+        return None
+    return file_format.name, file_format.extract(file_path)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,410 @@
+"""Persistent full-text index of a folder.
+
+Instead of opening every file on every search, a folder can be indexed once:
+the text of each file (as returned by search_functions.extract_file) is
+stored in a SQLite FTS5 table, and later searches of that folder are a
+single index query.  The table uses the trigram tokenizer, so a query
+matches any substring of the text, ignoring case, the same as a normal
+search does.
+
+Each indexed folder has its own database in the per-user cache folder.
+Along with the text, the index keeps the (size, mtime, inode) signature and
+the format of every file, and the mtime of every folder, so that refreshing
+it only reads the files that were added or changed since, and its matches
+are reported the way a search of the files reports them.  On Linux, an IndexWatcher can
+keep the index up to date while the application is running.
+"""
+import ctypes
+import ctypes.util
+import hashlib
+import os
+import select
+import sqlite3
+import struct
+import sys
+import threading
+
+from search_functions import as_terms, file_type, format_by_name, FORMATS
+from text_cache import default_cache_dir
+
+# Number of files to add between commits while building an index.
+COMMIT_EVERY = 200
+# Signature recorded for a file that couldn't be read.  It matches no real
+# file, so every refresh tries to read the file again.
+UNREAD_SIGNATURE = (-1, -1, -1)
+
+
+def index_path(folder):
+    """Return the path of the index database for a folder."""
+    folder = os.path.normcase(os.path.abspath(folder))
+    digest = hashlib.sha1(folder.encode('utf-8')).hexdigest()
+    return os.path.join(default_cache_dir(), 'indexes', digest + '.db')
+
+
+def has_index(folder):
+    """Return True if the folder has been indexed."""
+    return os.path.exists(index_path(folder))
+
+
+def file_signature(file):
+    """Return the (size, mtime, inode) of a path or os.DirEntry, used to spot changed files."""
+    if isinstance(file, os.DirEntry):
+        stat = file.stat()
+        return (stat.st_size, stat.st_mtime_ns, file.inode())
+    stat = os.stat(file)
+    return (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+
+def match_details(file_path, format_name):
+    """Return the details() function of a file's format, as recorded when it was indexed."""
+    # Indexes made before the format was recorded go by the file's name.
+    file_format = FORMATS.get(format_name) or format_by_name(file_path) or FORMATS['text']
+    return file_format.details
+
+
+class SearchIndex:
+    """Full-text index of the files in a folder."""
+    def __init__(self, folder):
+        self.folder = folder
+        self.db_path = index_path(folder)
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self.db = sqlite3.connect(self.db_path, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL UNIQUE,
+                size INTEGER NOT NULL,
+                mtime INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                format TEXT)""")
+        if 'format' not in [column[1] for column in self.db.execute("PRAGMA table_info(files)")]:
+            self.db.execute("ALTER TABLE files ADD COLUMN format TEXT")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS dirs (
+                path TEXT PRIMARY KEY,
+                mtime INTEGER NOT NULL)""")
+        self.db.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5(
+                file_id UNINDEXED, location UNINDEXED, text,
+                tokenize='trigram')""")
+        self.db.commit()
+        self.pending = 0
+
+    def clear(self):
+        """Remove every file from the index."""
+        with self.db:
+            self.db.execute("DELETE FROM chunks")
+            self.db.execute("DELETE FROM files")
+            self.db.execute("DELETE FROM dirs")
+
+    def add_file(self, file_path, signature, chunks, format_name=None):
+        """Add (or replace) a file and its (location, text) chunks.
+
+        signature is the file's (size, mtime, inode), see file_signature(),
+        and format_name the name of its format, from extract_file().
+        """
+        self.remove_file(file_path)
+        cursor = self.db.execute(
+            "INSERT INTO files (path, size, mtime, inode, format) VALUES (?, ?, ?, ?, ?)",
+            (file_path, *signature, format_name))
+        file_id = cursor.lastrowid
+        self.db.executemany(
+            "INSERT INTO chunks (file_id, location, text) VALUES (?, ?, ?)",
+            ((file_id, location, text) for location, text in chunks))
+        self.pending += 1
+        if self.pending >= COMMIT_EVERY:
+            self.commit()
+
+    def add_unread(self, file_path):
+        """Record a file that couldn't be read, with no text, so that it is read again by the next refresh.
+
+        Its folder's mtime is saved with the others, so without the record a
+        refresh would never look at the file again.
+        """
+        self.add_file(file_path, UNREAD_SIGNATURE, [])
+
+    def remove_file(self, file_path):
+        """Remove a file from the index, if it is there."""
+        row = self.db.execute("SELECT id FROM files WHERE path = ?", (file_path,)).fetchone()
+        if row is not None:
+            self.db.execute("DELETE FROM chunks WHERE file_id = ?", row)
+            self.db.execute("DELETE FROM files WHERE id = ?", row)
+
+    def remove_folder(self, folder):
+        """Remove every file and folder below folder from the index."""
+        prefix = os.path.join(folder, '')
+        for path, in self.db.execute("SELECT path FROM files WHERE substr(path, 1, ?) = ?",
+                                     (len(prefix), prefix)).fetchall():
+            self.remove_file(path)
+        self.db.execute("DELETE FROM dirs WHERE path = ? OR substr(path, 1, ?) = ?",
+                        (folder, len(prefix), prefix))
+
+    def save_dirs(self, dir_mtimes):
+        """Store the mtime of each folder that was walked."""
+        self.db.executemany("INSERT OR REPLACE INTO dirs (path, mtime) VALUES (?, ?)",
+                            dir_mtimes.items())
+
+    def scan_changes(self, end_event=None):
+        """Compare the folder with the index.
+
+        Returns (changed, deleted, dir_mtimes), where changed is a dict of
+        {path: signature} for the files that were added or modified, deleted
+        is a list of indexed files that no longer exist, and dir_mtimes holds
+        the current mtime of every folder.  Returns None if end_event is set
+        before the scan finishes.
+
+        Every folder is listed once.  Adding, removing or renaming a file
+        changes its folder's mtime, so in folders whose mtime is unchanged
+        only the files that are already indexed need to be checked.
+        """
+        indexed = {path: (size, mtime, inode) for path, size, mtime, inode
+                   in self.db.execute("SELECT path, size, mtime, inode FROM files")}
+        old_mtimes = dict(self.db.execute("SELECT path, mtime FROM dirs"))
+        changed, dir_mtimes = {}, {}
+
+        stack = [self.folder]
+        while stack:
+            if end_event is not None and end_event.is_set():
+                return None
+            directory = stack.pop()
+            try:
+                dir_mtime = os.stat(directory).st_mtime_ns
+                with os.scandir(directory) as entries:
+                    entries = list(entries)
+            except OSError:
+                continue
+            dir_mtimes[directory] = dir_mtime
+            unchanged = old_mtimes.get(directory) == dir_mtime
+
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                        continue
+                    if entry.path not in indexed:
+                        if unchanged or entry.name.startswith('~$') or not entry.is_file():
+                            continue
+                        if file_type(entry.path) is None:
+                            continue
+                    signature = file_signature(entry)
+                except OSError:
+                    continue
+                if indexed.pop(entry.path, None) != signature:
+                    changed[entry.path] = signature
+
+        # Whatever is left in the index wasn't found in the folder.
+        return changed, list(indexed), dir_mtimes
+
+    def commit(self):
+        self.db.commit()
+        self.pending = 0
+
+    def file_count(self):
+        """Return the number of files in the index."""
+        return self.db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def search(self, text, end_event=None):
+        """Yield (file_path, matches) for every indexed file that contains text.
+
+        text may be a string or a SearchTerms.  matches lists the details
+        of each match in the file, as a search of the file gives them (see
+        FileFormat.details), up to the terms' max_matches (see
+        SearchTerms.add()).
+        """
+        terms = as_terms(text)
+        if not terms.regex and all(len(term) >= 3 for term in terms.terms):
+            # Quote each term as an FTS5 string so it's matched as a substring.
+            query = "chunks MATCH ?"
+            arguments = (" OR ".join('"' + term.replace('"', '""') + '"' for term in terms.terms),)
+        else:
+            # A regular expression, or a term too short for a trigram: check
+            # every chunk with the compiled terms instead.
+            self.db.create_function('purr_match', 1, lambda chunk: terms.search(chunk) is not None,
+                                    deterministic=True)
+            query = "purr_match(chunks.text)"
+            arguments = ()
+        rows = self.db.execute(
+            "SELECT files.path, files.format, chunks.location, chunks.text FROM chunks"
+            " JOIN files ON files.id = chunks.file_id"
+            f" WHERE {query} ORDER BY files.path, chunks.rowid", arguments)
+
+        current_path, matches, wanted = None, [], True
+        for file_path, format_name, location, chunk in rows:
+            if end_event is not None and end_event.is_set():
+                return
+            if file_path != current_path:
+                if matches:
+                    yield current_path, matches
+                current_path, matches, wanted = file_path, [], True
+                details = match_details(file_path, format_name)
+            if not wanted:
+                continue  # The file already has all the matches wanted.
+            for detail in details(location, chunk, terms):
+                if not terms.add(matches, detail):
+                    wanted = False
+                    break
+        if matches:
+            yield current_path, matches
+
+    def close(self):
+        self.db.close()
+
+
+# inotify event flags, from <sys/inotify.h>.
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+              IN_DELETE | IN_DELETE_SELF)
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+
+def _load_inotify():
+    """Return libc if it provides inotify, otherwise None."""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1, libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class IndexWatcher(threading.Thread):
+    """Keep the index of a folder up to date from inotify events (Linux only).
+
+    Changes are collected until the folder has been quiet for SETTLE_TIME
+    seconds and are then applied to the index in one transaction.  If the
+    kernel drops events, the index is refreshed with scan_changes() instead.
+    The changed files are read on a pool of up to workers processes (see
+    search_engine.extract_files()); only the index is written from here.
+    """
+    SETTLE_TIME = 1.0
+
+    def __init__(self, folder, workers=None):
+        super().__init__(daemon=True)
+        self.folder = folder
+        self.workers = workers
+        self.stop_event = threading.Event()
+        self.libc = _load_inotify()
+        self.watches = {}  # Watch descriptor -> folder path.
+
+    @classmethod
+    def supported(cls):
+        """Return True if the platform can watch folders for changes."""
+        return _load_inotify() is not None
+
+    def stop(self):
+        """Signal the watcher to end."""
+        self.stop_event.set()
+
+    def watch(self, folder):
+        """Watch a folder and all of its subfolders."""
+        for root, dirs, files in os.walk(folder):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(root), WATCH_MASK)
+            if wd >= 0:
+                self.watches[wd] = root
+
+    def run(self):
+        if self.libc is None:
+            return
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            return
+        try:
+            self.watch(self.folder)
+            changed, rescan = set(), False
+            while not self.stop_event.is_set():
+                ready, _, _ = select.select([self.fd], [], [], self.SETTLE_TIME)
+                if ready:
+                    rescan |= self.readEvents(os.read(self.fd, 64 * 1024), changed)
+                elif changed or rescan:
+                    self.apply(changed, rescan)
+                    changed, rescan = set(), False
+        finally:
+            os.close(self.fd)
+
+    def readEvents(self, data, changed):
+        """Add the paths named in a buffer of inotify events to changed.
+
+        Returns True if the whole folder needs to be rescanned.
+        """
+        rescan = False
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                rescan = True
+            elif mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+            elif wd in self.watches and name:
+                path = os.path.join(self.watches[wd], name)
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        self.watch(path)
+                    # A folder moved in or out: let the scan sort it out.
+                    rescan = True
+                else:
+                    changed.add(path)
+        return rescan
+
+    def apply(self, changed, rescan):
+        """Bring the index up to date with the changed files."""
+        index = SearchIndex(self.folder)
+        try:
+            if rescan:
+                changes = index.scan_changes(self.stop_event)
+                if changes is None:
+                    return
+                signatures, deleted, dir_mtimes = changes
+                for path in deleted:
+                    index.remove_file(path)
+            else:
+                signatures, dir_mtimes = {}, None
+                for path in changed:
+                    name = os.path.basename(path)
+                    try:
+                        if os.path.isfile(path) and not name.startswith('~$') and file_type(path):
+                            signatures[path] = file_signature(path)
+                            continue
+                    except OSError:
+                        pass
+                    index.remove_file(path)
+
+            if signatures:
+                self.addFiles(index, signatures)
+            # The folders are only up to date once every file in them is.
+            if dir_mtimes is not None and not self.stop_event.is_set():
+                index.save_dirs(dir_mtimes)
+            index.commit()
+        finally:
+            index.close()
+
+    def addFiles(self, index, signatures):
+        """Read the files in signatures on the worker pool and add them to the index."""
+        from search_engine import default_workers, extract_files  # search_engine imports this module.
+        workers = min(self.workers or default_workers(), len(signatures))
+        for path, format_name, chunks, error in extract_files(list(signatures), self.stop_event, workers):
+            if error is None:
+                try:
+                    index.add_file(path, signatures[path], chunks, format_name)
+                except Exception as err:  # A streamed file that failed part way through.
+                    error = err
+            if error is not None:
+                index.add_unread(path)
+                if not self.stop_event.is_set():
+                    print(f"Error indexing {path}: {error}")
+# end class IndexWatcher(threading.Thread)
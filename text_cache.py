@@ -0,0 +1,157 @@
+"""On-disk cache of the text extracted from documents.
+
+Parsing PDF, Word, Excel and Visio files is by far the slowest part of a
+search, and the text of a document doesn't change between searches for
+different terms.  The extractors in search_functions return the text of a
+document as a list of (location, text) chunks, where location is a label
+such as "Page 3" or "Sheet: 'Data' | Cell: B12"; this module stores those
+chunks in a SQLite database keyed on the file's path, size and modification
+time, so an unchanged file is only parsed once.
+
+The cache is capped at a maximum size; when it grows past the cap the least
+recently used files are dropped.  A cache that can't be read or written
+(locked past its timeout, corrupt, or on a full disk) is treated as empty:
+the error is reported once and the files are read directly, so the cache
+never changes what a search finds.  Each thread of each process (the GUI, its
+search and index threads, and every search worker) opens its own connection
+to the database with get_cache().
+"""
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+
+# Default upper limit on the size of the stored (compressed) text.
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# Fraction of the cap to free up when evicting, so eviction isn't run on
+# every insert once the cache is full.
+EVICT_FRACTION = 0.1
+# A hit only updates a file's access time when the stored one is older than
+# this many seconds, so reading from the cache (a page of a PDF at a time)
+# doesn't take the database's write lock.  The LRU order only needs to be
+# this coarse.
+ACCESS_RESOLUTION = 60 * 60
+
+
+def default_cache_dir():
+    """Return the per-user folder that PurrSearch keeps its caches in."""
+    if sys.platform.startswith('win'):
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+        return os.path.join(base, 'Evertz', 'PurrSearch')
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'PurrSearch')
+
+
+class TextCache:
+    """SQLite store of extracted document text, with LRU eviction."""
+    def __init__(self, db_path=None, max_bytes=DEFAULT_MAX_BYTES):
+        if db_path is None:
+            db_path = os.path.join(default_cache_dir(), 'textcache.db')
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        # Several worker processes write at once; WAL lets readers carry on
+        # while another process is writing.
+        self.db = sqlite3.connect(db_path, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                path TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime INTEGER NOT NULL,
+                nbytes INTEGER NOT NULL,
+                accessed REAL NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (path, kind))""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS chunks_accessed ON chunks (accessed)")
+        self.db.commit()
+        self.total_bytes = self.db.execute("SELECT COALESCE(SUM(nbytes), 0) FROM chunks").fetchone()[0]
+        self.errors = 0
+
+    def get(self, path, kind, size, mtime):
+        """Return the cached chunks for a file, or None if it changed, isn't cached or can't be read."""
+        try:
+            row = self.db.execute(
+                "SELECT data, accessed FROM chunks WHERE path = ? AND kind = ? AND size = ? AND mtime = ?",
+                (path, kind, size, mtime)).fetchone()
+            if row is None:
+                return None
+            data, accessed = row
+            now = time.time()
+            if now - accessed > ACCESS_RESOLUTION:
+                with self.db:
+                    self.db.execute("UPDATE chunks SET accessed = ? WHERE path = ? AND kind = ?",
+                                    (now, path, kind))
+            return [tuple(chunk) for chunk in json.loads(zlib.decompress(data))]
+        except (sqlite3.Error, zlib.error, ValueError) as err:
+            self.failed(err)
+            return None
+
+    def put(self, path, kind, size, mtime, chunks):
+        """Store the chunks extracted from a file, replacing any older copy, if the cache can be written."""
+        data = zlib.compress(json.dumps(chunks, ensure_ascii=False).encode('utf-8'))
+        try:
+            with self.db:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (path, kind, size, mtime, len(data), time.time(), data))
+            self.total_bytes += len(data)
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+        except sqlite3.Error as err:
+            self.failed(err)
+
+    def failed(self, err):
+        """Report an error reading or writing the cache, the first time one happens."""
+        if not self.errors:
+            print(f"Text cache error, reading files directly: {err}")
+        self.errors += 1
+
+    def evict(self):
+        """Drop the least recently used files until the cache is under its cap."""
+        with self.db:
+            # Other processes write to the same database, so recount first.
+            self.total_bytes = self.db.execute("SELECT COALESCE(SUM(nbytes), 0) FROM chunks").fetchone()[0]
+            target = self.max_bytes * (1 - EVICT_FRACTION)
+            rows = self.db.execute("SELECT path, kind, nbytes FROM chunks ORDER BY accessed")
+            stale = []
+            for path, kind, nbytes in rows:
+                if self.total_bytes <= target:
+                    break
+                stale.append((path, kind))
+                self.total_bytes -= nbytes
+            rows.close()
+            self.db.executemany("DELETE FROM chunks WHERE path = ? AND kind = ?", stale)
+
+    def clear(self):
+        """Remove everything from the cache."""
+        with self.db:
+            self.db.execute("DELETE FROM chunks")
+        self.db.execute("VACUUM")
+        self.total_bytes = 0
+
+    def close(self):
+        self.db.close()
+
+
+# This thread's (pid, TextCache).  A connection can only be used by the
+# thread that opened it, and must not be shared with a forked worker process.
+_local = threading.local()
+
+
+def get_cache():
+    """Return this thread's TextCache, or None if the cache can't be opened."""
+    pid, cache = getattr(_local, 'cache', (None, None))
+    if pid != os.getpid():
+        try:
+            cache = TextCache()
+        except (OSError, sqlite3.Error) as err:
+            print(f"Text cache disabled: {err}")
+            cache = None
+        _local.cache = (os.getpid(), cache)
+    return cache